@@ -1,4 +1,5 @@
 
-__all__ = ['WiretapHandler']
+__all__ = ['WiretapHandler', 'register_backend', 'use_backend']
 
 from wiretap import WiretapHandler
+from backend import register_backend, use_backend
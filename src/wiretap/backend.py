@@ -0,0 +1,148 @@
+# coding: utf-8
+
+import os
+import imp
+import logging
+import threading
+
+
+DISCREET_PATH = "/usr/discreet"
+WIRETAP_DEFAULT_VERSION = "2018.3"
+WIRETAP_VERSION = os.environ.get('WIRETAP_VERSION', WIRETAP_DEFAULT_VERSION)
+WIRETAP_DEFAULT_BACKEND = "native"
+logger = logging.getLogger(__name__)
+
+
+def import_wiretap_library(version=WIRETAP_VERSION):
+    logger.info('Use Wiretap version %s.' % version)
+    library_path = os.path.join(
+        DISCREET_PATH, 'python', version, 'lib', 'python2.7', 'site-packages', 'adsk',
+        'libwiretapPythonClientAPI.so')
+    return imp.load_dynamic('libwiretapPythonClientAPI', library_path)
+
+
+def _import_memory_backend():
+    import memory
+    return memory
+
+
+_loaders = {
+    'native': import_wiretap_library,
+    'memory': _import_memory_backend,
+}
+_selected = os.environ.get('WIRETAP_BACKEND', WIRETAP_DEFAULT_BACKEND)
+_loaded = None
+_stats = None
+_instrumented = None
+_lock = threading.Lock()
+
+
+def register_backend(name, loader):
+    """
+    Register an implementation of the Wiretap client API.
+
+    A backend is any object exposing the names of the Wiretap python client API
+    used by this package (WireTapClientInit, WireTapServerHandle, WireTapNodeHandle,
+    WireTapStr, WireTapInt...).
+
+    :param name: name of the backend
+    :type name: string
+    :param loader: callable returning the backend, called on first use only
+    :type loader: callable
+    """
+    _loaders[name] = loader
+
+
+def backends():
+    """
+    Names of the registered backends
+
+    :rtype: list
+    """
+    return sorted(_loaders.keys())
+
+
+def use_backend(name):
+    """
+    Select the backend used by the next Wiretap call.
+    Switching backend while handlers are alive is not supported.
+
+    :param name: name of a registered backend
+    :type name: string
+    """
+    global _selected, _loaded, _instrumented
+    if name not in _loaders:
+        raise ValueError("Unknown Wiretap backend '%s' (available: %s)" % (name, ", ".join(backends())))
+    with _lock:
+        if name != _selected:
+            _selected = name
+            _loaded = None
+            _instrumented = None
+            wt._reset()
+
+
+def current_backend():
+    """
+    Name of the selected backend
+    """
+    return _selected
+
+
+def instrument(stats):
+    """
+    Record the Wiretap calls made from now on, or stop recording them.
+    Handles opened before the switch keep their previous behaviour.
+
+    :param stats: where calls are recorded, None to stop recording
+    :type stats: instrument.Stats
+    """
+    global _stats, _instrumented
+    with _lock:
+        _stats = stats
+        _instrumented = None
+        wt._reset()
+
+
+def get_backend():
+    """
+    Return the selected backend, loading it on first call
+
+    :return: the Wiretap client API implementation
+    """
+    global _loaded, _instrumented
+    if _loaded is None:
+        with _lock:
+            if _loaded is None:
+                if _selected not in _loaders:
+                    raise ValueError("Unknown Wiretap backend '%s' (available: %s)" % (_selected, ", ".join(backends())))
+                logger.debug("Load Wiretap backend '%s'", _selected)
+                _loaded = _loaders[_selected]()
+    if _stats is None:
+        return _loaded
+    if _instrumented is None:
+        with _lock:
+            if _instrumented is None and _stats is not None:
+                from instrument import InstrumentedBackend
+                _instrumented = InstrumentedBackend(_loaded, _stats)
+    return _instrumented or _loaded
+
+
+class LazyBackend(object):
+    """
+    Stand-in for the Wiretap client API module which loads the selected backend
+    on first attribute access. Resolved attributes are kept on the instance so
+    that later accesses cost a plain attribute lookup.
+    """
+
+    def __getattr__(self, name):
+        if name.startswith('__'):
+            raise AttributeError(name)
+        value = getattr(get_backend(), name)
+        setattr(self, name, value)
+        return value
+
+    def _reset(self):
+        self.__dict__.clear()
+
+
+wt = LazyBackend()
@@ -0,0 +1,185 @@
+# coding: utf-8
+"""
+Run many operations over a single handler.
+
+Operations are read from JSON Lines or YAML, one object per operation:
+
+    {"op": "create-project", "name": "PROJ_A", "settings": {"FrameRate": "25 fps"}, "libraries": {"Libraries": ["EDIT"]}}
+    {"op": "create-user", "name": "bob"}
+    {"op": "delete-user", "name": "alice"}
+
+Operations on the same project or user run in the order they are given,
+the following ones being skipped if one fails. Other operations run
+concurrently, each worker thread using its own server handle.
+"""
+
+import json
+import time
+import Queue
+import logging
+from multiprocessing.pool import ThreadPool
+
+import yaml
+
+import operations
+from wiretap import WiretapException
+from pool import ThreadServers
+
+
+logger = logging.getLogger(__name__)
+
+# Kind of node each batch operation works on
+OPERATION_KINDS = {
+    'create-project': 'project',
+    'create-user': 'user',
+    'delete-user': 'user',
+}
+
+
+class BatchResult(object):
+    """Outcome of an operation of a batch"""
+
+    def __init__(self, index, operation, value=None, error=None, skipped=False, elapsed=0.0):
+        """
+
+        :param index: position of the operation in the batch
+        :type index: int
+        :param operation: the operation, ex: {'op': 'create-user', 'name': 'bob'}
+        :type operation: dict
+        :param value: value returned by the operation
+        :param error: error message, None on success
+        :type error: string
+        :param skipped: whether the operation did not run because a previous
+            operation on the same node failed
+        :type skipped: bool
+        :param elapsed: duration of the operation in seconds
+        :type elapsed: float
+        """
+        self.index = index
+        self.operation = operation
+        self.value = value
+        self.error = error
+        self.skipped = skipped
+        self.elapsed = elapsed
+
+    @property
+    def ok(self):
+        return self.error is None
+
+    def to_dict(self):
+        result = {
+            'index': self.index, 'op': self.operation['op'], 'name': self.operation['name'],
+            'ok': self.ok, 'seconds': round(self.elapsed, 3)}
+        if self.ok:
+            result['result'] = self.value
+        else:
+            result['error'] = self.error
+            result['skipped'] = self.skipped
+        return result
+
+
+def load(stream, file_format='auto'):
+    """
+    Read operations
+
+    :param stream: file holding the operations
+    :type stream: file
+    :param file_format: 'jsonl', 'yaml' or 'auto' to try JSON Lines first
+    :type file_format: string
+    :return: operations
+    :rtype: list
+    :raises WiretapException: if an operation is invalid
+    """
+    text = stream.read()
+    items = None
+    if file_format in ('auto', 'jsonl'):
+        try:
+            items = [json.loads(line) for line in text.splitlines() if line.strip()]
+        except ValueError as e:
+            if file_format == 'jsonl':
+                raise WiretapException("Invalid JSON Lines operations: %s" % e)
+    if items is None:
+        items = []
+        try:
+            for document in yaml.safe_load_all(text):
+                if isinstance(document, list):
+                    items.extend(document)
+                elif document is not None:
+                    items.append(document)
+        except yaml.YAMLError as e:
+            raise WiretapException("Invalid YAML operations: %s" % e)
+
+    for (index, item) in enumerate(items):
+        if not isinstance(item, dict) or item.get('op') not in OPERATION_KINDS or not item.get('name'):
+            raise WiretapException(
+                "Invalid operation #%d: %r (expected an 'op' among %s and a 'name')" % (
+                    index, item, ", ".join(sorted(OPERATION_KINDS))))
+    return items
+
+
+def run(handler, batch, workers=8):
+    """
+    Run operations, yielding their results as they complete
+
+    :param handler: handler connected to the server
+    :type handler: WiretapHandler
+    :param batch: operations, as returned by load
+    :type batch: list
+    :param workers: maximum number of operations run concurrently
+    :type workers: int
+    :return: BatchResult of every operation, in completion order
+    :rtype: generator
+    """
+    # operations on a same node are chained, the head of each chain can run
+    chains = dict()
+    heads = []
+    for (index, operation) in enumerate(batch):
+        key = (OPERATION_KINDS[operation['op']], operation['name'])
+        if key not in chains:
+            chains[key] = []
+            heads.append(key)
+        chains[key].append(index)
+    if not batch:
+        return
+
+    servers = ThreadServers(handler)
+    results = Queue.Queue()
+
+    def execute(index):
+        operation = batch[index]
+        params = dict((k, v) for (k, v) in operation.items() if k != 'op')
+        start = time.time()
+        try:
+            handler._bind_server(servers.get())
+            value = operations.run(handler, operation['op'], params)
+        except Exception as e:
+            logger.debug("Operation #%d failed: %s", index, e)
+            return BatchResult(index, operation, error=str(e) or repr(e), elapsed=time.time() - start)
+        return BatchResult(index, operation, value=value, elapsed=time.time() - start)
+
+    pool = ThreadPool(max(1, min(workers, len(heads))))
+    try:
+        def submit(key):
+            index = chains[key].pop(0)
+            pool.apply_async(execute, (index,), callback=lambda result: results.put((key, result)))
+
+        for key in heads:
+            submit(key)
+
+        for _ in range(len(batch)):
+            key, result = results.get()
+            if chains[key]:
+                if result.ok:
+                    submit(key)
+                else:
+                    # do not run the following operations on a node which failed
+                    for index in chains[key]:
+                        results.put((key, BatchResult(
+                            index, batch[index], skipped=True,
+                            error="Skipped: operation #%d on %s %s failed" % ((result.index,) + key))))
+                    chains[key] = []
+            yield result
+    finally:
+        pool.close()
+        pool.join()
+        servers.release()
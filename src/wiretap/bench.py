@@ -0,0 +1,244 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Benchmarks of WiretapHandler operations against the in-memory backend.
+
+Each benchmark runs on a freshly populated in-memory server and reports the
+wall time and the number of server round trips of the operation. Results can
+be saved as JSON and compared with the results of another commit:
+
+    python -m wiretap.bench --latency 0.001 --output before.json
+    python -m wiretap.bench --latency 0.001 --compare before.json
+"""
+
+import os
+import sys
+import json
+import time
+import logging
+import argparse
+import subprocess
+
+import backend
+import memory
+import wiretap
+from wiretap import WiretapHandler, WiretapNodeType
+
+__author__ = "Sylvain Maziere"
+
+BENCHMARKS = []
+# project holding the generated clips
+CLIPS_PROJECT = 'bench_clips'
+
+
+def benchmark(name):
+    """
+    Register a benchmark. The decorated function receives the populated
+    handler and the options, and returns a callable running the measured
+    operation.
+    """
+    def register(setup):
+        BENCHMARKS.append((name, setup))
+        return setup
+    return register
+
+
+@benchmark('get_projects')
+def bench_get_projects(handler, options):
+    return handler.get_projects
+
+
+@benchmark('get_projects (cached)')
+def bench_get_projects_cached(handler, options):
+    handler.get_projects()
+    return handler.get_projects
+
+
+@benchmark('get_users')
+def bench_get_users(handler, options):
+    return handler.get_users
+
+
+@benchmark('create_project')
+def bench_create_project(handler, options):
+    return lambda: handler.create_project('bench_project', {'FrameWidth': '1920', 'FrameHeight': '1080'})
+
+
+@benchmark('create_user')
+def bench_create_user(handler, options):
+    return lambda: handler.create_user('bench_user', workers=options.workers)
+
+
+@benchmark('_get_node (library list)')
+def bench_get_node(handler, options):
+    project = handler.get_project(CLIPS_PROJECT)
+    return lambda: handler._get_node(project, 'Libraries', WiretapNodeType.LibraryList)
+
+
+@benchmark('_get_node (last clip)')
+def bench_get_node_clip(handler, options):
+    project = handler.get_project(CLIPS_PROJECT)
+    clip_name = 'clip_%06d' % (options.clips - 1)
+    return lambda: handler._get_node(project, clip_name, WiretapNodeType.Clip)
+
+
+def run_benchmark(setup, options):
+    """
+    Run a benchmark options.repeat times on fresh servers
+
+    :return: best wall time in seconds and round trips of the operation
+    :rtype: dict
+    """
+    timings = []
+    round_trips = None
+    for _ in range(options.repeat):
+        # pooled server handles would keep serving the previous databases
+        wiretap._servers.clear()
+        memory.reset()
+        memory.set_latency(0.0)
+        memory.populate(options.hostname, projects=options.projects, users=options.users)
+        memory.add_project(
+            options.hostname, CLIPS_PROJECT, libraries=options.libraries, clips=options.clips)
+        handler = WiretapHandler(hostname=options.hostname)
+        try:
+            operation = setup(handler, options)
+            memory.set_latency(options.latency)
+            memory.reset_counts()
+            start = time.time()
+            operation()
+            timings.append(time.time() - start)
+            round_trips = memory.call_counts()
+        finally:
+            memory.set_latency(0.0)
+            handler.close()
+
+    return {
+        'wall_time': min(timings),
+        'round_trips': sum(round_trips.values()),
+        'calls': round_trips}
+
+
+def current_revision():
+    """
+    Short git revision of the working tree, used to label saved results
+    """
+    try:
+        with open(os.devnull, 'w') as devnull:
+            return subprocess.check_output(
+                ['git', 'rev-parse', '--short', 'HEAD'], stderr=devnull).strip()
+    except Exception:
+        return 'unknown'
+
+
+def print_results(results, baseline=None):
+    print "%-28s %12s %12s" % ('operation', 'wall (ms)', 'round trips'),
+    print " %12s %12s" % ('wall delta', 'trips delta') if baseline else ""
+    for name, _ in BENCHMARKS:
+        if name not in results:
+            continue
+        result = results[name]
+        print "%-28s %12.2f %12d" % (name, result['wall_time'] * 1000, result['round_trips']),
+        reference = baseline.get(name) if baseline else None
+        if reference:
+            print " %+11.1f%% %+12d" % (
+                delta_percent(reference['wall_time'], result['wall_time']),
+                result['round_trips'] - reference['round_trips'])
+        else:
+            print ""
+
+
+def delta_percent(before, after):
+    if not before:
+        return 0.0
+    return (after - before) * 100.0 / before
+
+
+def regressions(results, baseline, threshold):
+    """
+    Names of the benchmarks slower than the baseline by more than threshold percent,
+    or doing more round trips
+    """
+    names = []
+    for name, result in sorted(results.items()):
+        reference = baseline.get(name)
+        if not reference:
+            continue
+        if result['round_trips'] > reference['round_trips'] or \
+                delta_percent(reference['wall_time'], result['wall_time']) > threshold:
+            names.append(name)
+    return names
+
+
+def parse_args(args):
+    parser = argparse.ArgumentParser(
+        prog='wiretap.bench',
+        description="Benchmark WiretapHandler operations against an in-memory server",
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument(
+        '--latency', type=float, default=0.0005,
+        help='Latency in seconds added to each server call')
+    parser.add_argument(
+        '--projects', type=int, default=1000, help='Number of projects on the server')
+    parser.add_argument(
+        '--users', type=int, default=100, help='Number of users on the server')
+    parser.add_argument(
+        '--libraries', type=int, default=10, help='Number of libraries of the clips project')
+    parser.add_argument(
+        '--clips', type=int, default=10000, help='Number of clips of the clips project')
+    parser.add_argument(
+        '--workers', type=int, default=8, help='Concurrent node creations')
+    parser.add_argument(
+        '--repeat', type=int, default=3, help='Number of runs, the best one is kept')
+    parser.add_argument(
+        '--filter', '-k', help='Only run benchmarks whose name contains this string')
+    parser.add_argument(
+        '--output', '-o', help='Save results to this JSON file')
+    parser.add_argument(
+        '--compare', '-c', type=argparse.FileType('r'),
+        help='JSON results to compare with')
+    parser.add_argument(
+        '--threshold', type=float, default=10.0,
+        help='Slowdown in percent reported as a regression')
+    parser.add_argument(
+        '--hostname', default='bench', help=argparse.SUPPRESS)
+    return parser.parse_args(args)
+
+
+def main(args):
+    options = parse_args(args)
+    backend.use_backend('memory')
+
+    results = dict()
+    for name, setup in BENCHMARKS:
+        if options.filter and options.filter not in name:
+            continue
+        results[name] = run_benchmark(setup, options)
+
+    baseline = None
+    if options.compare:
+        baseline = json.load(options.compare)['results']
+    print_results(results, baseline)
+
+    if options.output:
+        with open(options.output, 'w') as f:
+            json.dump({
+                'revision': current_revision(),
+                'date': time.strftime('%Y-%m-%dT%H:%M:%S'),
+                'options': dict((k, v) for (k, v) in vars(options).items() if k not in ('compare',)),
+                'results': results}, f, indent=2, sort_keys=True)
+
+    if baseline:
+        slower = regressions(results, baseline, options.threshold)
+        if slower:
+            print "Regressions: %s" % ", ".join(slower)
+            return 1
+    return 0
+
+
+def run():
+    logging.basicConfig(level=logging.WARNING, stream=sys.stderr)
+    sys.exit(main(sys.argv[1:]))
+
+
+if __name__ == "__main__":
+    run()
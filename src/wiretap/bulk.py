@@ -0,0 +1,145 @@
+# coding: utf-8
+
+import logging
+import threading
+from multiprocessing.pool import ThreadPool
+
+from wiretap import WiretapException
+from pool import ThreadServers
+
+
+logger = logging.getLogger(__name__)
+
+
+class NodeSpec(object):
+    """Description of a node to create and of its children"""
+
+    def __init__(self, name, node_type, children=None):
+        """
+
+        :param name: name of the node
+        :type name: string
+        :param node_type: type of the node
+        :type node_type: string
+        :param children: nodes to create under this one
+        :type children: list of NodeSpec
+        """
+        self.name = name
+        self.node_type = node_type
+        self.children = children or []
+
+    def __repr__(self):
+        return "NodeSpec(%r, %r, %d children)" % (self.name, self.node_type, len(self.children))
+
+    def count(self):
+        """
+        Number of nodes described by this spec, itself included
+        """
+        return 1 + sum(child.count() for child in self.children)
+
+
+class BulkCreateError(WiretapException):
+    """Raised when some nodes of a bulk creation failed"""
+
+    def __init__(self, failures, created):
+        """
+
+        :param failures: (path, error message) of each node which could not be created
+        :type failures: list
+        :param created: paths of the top level nodes, None for those which failed
+        :type created: list
+        """
+        self.failures = failures
+        self.created = created
+        WiretapException.__init__(
+            self, "Unable to create %d node(s):\n%s" % (
+                len(failures), "\n".join("- %s: %s" % f for f in failures)))
+
+
+class BulkNodeCreator(object):
+    """
+    Create trees of nodes with a bounded pool of worker threads.
+
+    Siblings are created concurrently, each worker using its own server
+    handle, and the children of a node are queued as soon as their parent
+    exists. Errors do not stop the creation of unrelated nodes, they are
+    reported together once everything else has been created.
+    """
+
+    def __init__(self, handler, workers=8):
+        """
+
+        :param handler: handler used to reach the server
+        :type handler: WiretapHandler
+        :param workers: maximum number of concurrent node creations
+        :type workers: int
+        """
+        self.handler = handler
+        self.workers = max(1, workers)
+        self._servers = ThreadServers(handler)
+
+    def create(self, parent_path, specs):
+        """
+        Create nodes under a parent node
+
+        :param parent_path: path of the parent node
+        :type parent_path: string
+        :param specs: nodes to create
+        :type specs: list of NodeSpec
+        :return: paths of the created top level nodes, in the order of specs
+        :rtype: list
+        :raises BulkCreateError: if at least one node could not be created
+        """
+        created = [None] * len(specs)
+        failures = []
+        state = {'pending': 0}
+        done = threading.Condition()
+        pool = ThreadPool(self.workers)
+
+        def submit(parent, spec, position=None):
+            with done:
+                state['pending'] += 1
+            pool.apply_async(
+                self._create_one, (parent, spec),
+                callback=lambda result: finished(parent, spec, position, result))
+
+        def finished(parent, spec, position, result):
+            path, error = result
+            if error is None:
+                if position is not None:
+                    created[position] = path
+                for child in spec.children:
+                    submit(path, child)
+            else:
+                skipped = spec.count() - 1
+                if skipped:
+                    error = "%s (%d descendant node(s) skipped)" % (error, skipped)
+                logger.error("Unable to create %s/%s: %s", parent, spec.name, error)
+                with done:
+                    failures.append(("%s/%s" % (parent.rstrip('/'), spec.name), error))
+            with done:
+                state['pending'] -= 1
+                done.notify_all()
+
+        try:
+            for position, spec in enumerate(specs):
+                submit(parent_path, spec, position)
+            with done:
+                while state['pending']:
+                    done.wait(1)
+        finally:
+            pool.close()
+            pool.join()
+            self._servers.release()
+
+        if failures:
+            raise BulkCreateError(failures, created)
+        return created
+
+    def _create_one(self, parent_path, spec):
+        try:
+            path = self.handler._create_child_node(
+                self._servers.get(), parent_path, spec.node_type, spec.name)
+            return path, None
+        except Exception as e:
+            return None, str(e)
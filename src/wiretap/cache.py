@@ -0,0 +1,149 @@
+# coding: utf-8
+
+import time
+import threading
+from collections import OrderedDict
+
+
+class NodeCache(object):
+    """
+    Bounded LRU cache of Wiretap lookups keyed by node path.
+
+    Entries are stored under a ``(kind, path)`` key so that resolved node
+    handles and children listings of the same path can be invalidated together.
+    """
+
+    def __init__(self, max_size=1024, ttl=None):
+        """
+
+        :param max_size: maximum number of entries kept in the cache
+        :type max_size: int
+        :param ttl: time to live of an entry in seconds, None to disable expiration
+        :type ttl: float
+        """
+        self.max_size = max_size
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._lock = threading.RLock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, kind, path):
+        """
+        Retrieve a cached value
+
+        :param kind: kind of the cached value (ex: 'node', 'children')
+        :type kind: string
+        :param path: the path of the node
+        :type path: string
+        :return: the cached value or None
+        """
+        return self.get_any((kind,), path)
+
+    def get_any(self, kinds, path):
+        """
+        Retrieve the first cached value of several kinds, counted as a single lookup
+
+        :param kinds: kinds of the cached value, in order of preference
+        :type kinds: tuple
+        :param path: the path of the node
+        :type path: string
+        :return: the cached value or None
+        """
+        with self._lock:
+            for kind in kinds:
+                key = (kind, path)
+                entry = self._entries.get(key)
+                if entry is None:
+                    continue
+                value, timestamp = entry
+                if self.ttl is None or time.time() - timestamp < self.ttl:
+                    # move entry to the most recently used position
+                    del self._entries[key]
+                    self._entries[key] = entry
+                    self.hits += 1
+                    return value
+                del self._entries[key]
+            self.misses += 1
+            return None
+
+    def set(self, kind, path, value):
+        """
+        Store a value in the cache, evicting the least recently used entries if needed
+
+        :param kind: kind of the cached value (ex: 'node', 'children')
+        :type kind: string
+        :param path: the path of the node
+        :type path: string
+        :param value: the value to cache
+        """
+        if self.max_size <= 0:
+            return
+        key = (kind, path)
+        with self._lock:
+            self._entries.pop(key, None)
+            self._entries[key] = (value, time.time())
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def values(self):
+        """
+        Values of the entries which did not expire, without counting lookups
+
+        :rtype: list
+        """
+        now = time.time()
+        with self._lock:
+            return [value for (value, timestamp) in self._entries.values()
+                    if self.ttl is None or now - timestamp < self.ttl]
+
+    def pop(self, kind, path):
+        """
+        Drop the entry of a path, leaving its descendants
+
+        :param kind: kind of the cached value (ex: 'node', 'children')
+        :type kind: string
+        :param path: the path of the node
+        :type path: string
+        """
+        with self._lock:
+            self._entries.pop((kind, path), None)
+
+    def invalidate(self, path):
+        """
+        Drop every entry of a path and of its descendants
+
+        :param path: the path of the node
+        :type path: string
+        """
+        prefix = path.rstrip('/') + '/'
+        with self._lock:
+            for key in list(self._entries.keys()):
+                if key[1] == path or key[1].startswith(prefix):
+                    del self._entries[key]
+
+    def clear(self):
+        """
+        Drop all entries
+        """
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        """
+        Return cache counters
+
+        :return: hits, misses, evictions and size of the cache
+        :rtype: dict
+        """
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'size': len(self._entries)}
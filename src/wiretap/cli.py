@@ -3,14 +3,46 @@
 
 import os
 import sys
+import csv
+import json
+import time
+import Queue
 import logging
 import argparse
+import threading
 import yaml
 
 import wiretap
+import batch
+import clone
+import backend
+import fleet
+import snapshot
+import daemon
+import diskcache
+import export
+import ingest
+import instrument
+import operations
+import placement
+from bulk import BulkCreateError
 
 __author__ = "Sylvain Maziere"
 
+logger = logging.getLogger(__name__)
+
+# Commands which can run on several servers at once
+FLEET_COMMANDS = ('list-project', 'list-user', 'watch')
+
+# Commands writing their data to the standard output when their output is -
+STDOUT_COMMANDS = ('dump', 'export-clip')
+
+# Node listings which can be answered from the disk cache
+LISTINGS = {
+    '/projects': 'list-project',
+    '/users': 'list-user',
+}
+
 
 def parse_args(args):
     parser = argparse.ArgumentParser(
@@ -20,8 +52,55 @@ def parse_args(args):
 
     parser.add_argument(
         '--server', '-s',
-        default='localhost',
-        help='Wiretap server to connect')
+        action='append', default=argparse.SUPPRESS,
+        help='Wiretap server to connect, can be repeated or hold comma '
+             'separated servers (default: localhost)')
+    parser.add_argument(
+        '--server-file',
+        type=argparse.FileType('r'),
+        help='File with one Wiretap server per line')
+    parser.add_argument(
+        '--parallel', '-j',
+        type=int, default=16,
+        help='Number of servers queried at the same time')
+    parser.add_argument(
+        '--timeout',
+        type=float, default=30,
+        help='Maximum time in seconds to wait for each server')
+    parser.add_argument(
+        '--max-age',
+        type=float,
+        help='Answer read commands from the disk cache when it is not older than '
+             'this number of seconds')
+    parser.add_argument(
+        '--cache-dir',
+        default=diskcache.DEFAULT_CACHE_DIR,
+        help='Directory of the disk cache')
+    parser.add_argument(
+        '--backend',
+        default=backend.current_backend(),
+        choices=backend.backends(),
+        help='Wiretap client API implementation')
+    parser.add_argument(
+        '--stats',
+        action='store_true',
+        help='Print the count and latency of Wiretap calls on exit')
+    parser.add_argument(
+        '--prometheus',
+        metavar='FILE',
+        help='Write the Wiretap call statistics to a Prometheus node exporter text file')
+    parser.add_argument(
+        '--trace',
+        metavar='FILE',
+        help='Write a Chrome trace (chrome://tracing, Perfetto) of the Wiretap calls')
+    parser.add_argument(
+        '--socket',
+        default=daemon.DEFAULT_SOCKET,
+        help='Unix socket of the wiretap daemon')
+    parser.add_argument(
+        '--no-daemon',
+        dest='daemon', action='store_false', default=argparse.SUPPRESS,
+        help='Connect to the servers directly even if a daemon is running')
 
     sub_parser = parser.add_subparsers(
         title='commands',
@@ -64,9 +143,232 @@ def parse_args(args):
         '--description', help='Project description')
     parser_createproject.add_argument(
         '--setupdir', '-s', help='Setup directory')
+    parser_createproject.add_argument(
+        '--volume', help='Volume to create the project on (default: chosen by --placement)')
+    parser_createproject.add_argument(
+        '--placement', default='first', choices=sorted(placement.POLICIES),
+        help='How to choose the volume of the project: the first one, the one with the most '
+             'free space, the one with the fewest projects or each in turn (default: %(default)s)')
     parser_createproject.add_argument(
         '--libraries-file', type=argparse.FileType('r'),
         help='YAML file describing Libraries to create in project.')
+    parser_createproject.add_argument(
+        '--dry-run', '-n', action='store_true',
+        help='Print the nodes which would be created and exit')
+    parser_createproject.add_argument(
+        '--workers', '-w', type=int, default=8,
+        help="Number of nodes created concurrently")
+
+    parser_cloneproject = sub_parser.add_parser(
+        'clone-project',
+        help="Copy a project settings and libraries to other servers")
+    parser_cloneproject.add_argument(
+        'name', help="Name of the project on the source server (--server)")
+    parser_cloneproject.add_argument(
+        '--to', action='append',
+        help="Destination server, can be repeated or hold comma separated servers")
+    parser_cloneproject.add_argument(
+        '--to-file', type=argparse.FileType('r'),
+        help="File with one destination server per line")
+    parser_cloneproject.add_argument(
+        '--as', dest='new_name',
+        help="Name of the project on the destination servers (default: same name)")
+    parser_cloneproject.add_argument(
+        '--dry-run', '-n', action='store_true',
+        help="Print the libraries and folders which would be created on each server")
+    parser_cloneproject.add_argument(
+        '--workers', '-w', type=int, default=8,
+        help="Number of nodes created concurrently on each server")
+    parser_cloneproject.add_argument(
+        '--host-timeout', type=float,
+        help="Maximum time in seconds to clone to each server (default: no limit)")
+
+    parser_updateprojects = sub_parser.add_parser(
+        'update-projects',
+        help="Change settings of projects matching a pattern")
+    parser_updateprojects.add_argument(
+        'pattern', help="Glob pattern matching project names, or regular expression with --regex")
+    parser_updateprojects.add_argument(
+        '--set', dest='settings', action='append', default=[], metavar='KEY=VALUE',
+        help="Setting to change, ex: SetupDir=/mnt/setups (can be repeated)")
+    parser_updateprojects.add_argument(
+        '--unset', action='append', default=[], metavar='KEY',
+        help="Setting to remove (can be repeated)")
+    parser_updateprojects.add_argument(
+        '--setupdir', help='Setup directory')
+    parser_updateprojects.add_argument(
+        '--description', help='Project description')
+    parser_updateprojects.add_argument(
+        '--regex', '-r', action='store_true',
+        help="Match project names with a regular expression")
+    parser_updateprojects.add_argument(
+        '--ignore-case', '-i', action='store_true',
+        help="Match project names regardless of case")
+    parser_updateprojects.add_argument(
+        '--dry-run', '-n', action='store_true',
+        help="Print the settings which would change and exit")
+    parser_updateprojects.add_argument(
+        '--workers', '-w', type=int, default=8,
+        help="Number of projects updated concurrently")
+
+    parser_projectinfo = sub_parser.add_parser(
+        'project-info',
+        help="Print settings of projects")
+    parser_projectinfo.add_argument(
+        'name', nargs='*', help='Project name (default: all projects)')
+    parser_projectinfo.add_argument(
+        '--format', '-f', default='text', choices=['text', 'json', 'csv'],
+        help='Output format')
+    parser_projectinfo.add_argument(
+        '--workers', '-w', type=int, default=8,
+        help="Number of projects read concurrently")
+
+    # tree
+    parser_tree = sub_parser.add_parser(
+        'tree',
+        help="Print the node tree of the Wiretap database")
+    parser_tree.add_argument(
+        'path', nargs='?', default='/', help="Path of the node to start from")
+    parser_tree.add_argument(
+        '--depth', '-d', type=int, help="Maximum depth to walk")
+    parser_tree.add_argument(
+        '--type', '-t', dest='node_types', action='append',
+        help="Only print nodes of this type, can be repeated")
+
+    parser_find = sub_parser.add_parser(
+        'find',
+        help="Search nodes by name and type")
+    parser_find.add_argument(
+        'pattern', help="Glob pattern matching node names, or regular expression with --regex")
+    parser_find.add_argument(
+        '--path', default='/', help="Node to search from")
+    parser_find.add_argument(
+        '--type', '-t', dest='node_types', action='append',
+        help="Only find nodes of this type, ex: CLIP (can be repeated)")
+    parser_find.add_argument(
+        '--regex', '-r', action='store_true',
+        help="Search names with a regular expression")
+    parser_find.add_argument(
+        '--ignore-case', '-i', action='store_true',
+        help="Match names regardless of case")
+    parser_find.add_argument(
+        '--limit', '-l', type=int,
+        help="Stop after this number of matches")
+    parser_find.add_argument(
+        '--depth', type=int,
+        help="Maximum depth to search, 1 for the children only")
+    parser_find.add_argument(
+        '--workers', '-w', type=int, default=8,
+        help="Number of nodes listed concurrently")
+
+    # clip
+    parser_export = sub_parser.add_parser(
+        'export-clip',
+        help="Export frames of a clip")
+    parser_export.add_argument(
+        'path', help="Path of the clip node")
+    parser_export.add_argument(
+        'output',
+        help="Output file name with a frame number format, ex: shot.%%04d.raw, to write "
+             "one file per frame, otherwise all frames are written to this file (- for stdout)")
+    parser_export.add_argument(
+        '--range', dest='frame_range',
+        help="Frames to export, from 0, ex: 10-20 or 10- (default: all frames)")
+    parser_export.add_argument(
+        '--readers', '-r', type=int, default=4,
+        help="Number of frames read concurrently")
+    parser_export.add_argument(
+        '--buffers', type=int,
+        help="Number of preallocated frame buffers (default: twice the readers)")
+
+    parser_import = sub_parser.add_parser(
+        'import-frames',
+        help="Create a clip from raw frame files")
+    parser_import.add_argument(
+        'path', help="Path of the library or folder receiving the clip")
+    parser_import.add_argument(
+        'name', help="Name of the clip")
+    parser_import.add_argument(
+        'sources', nargs='+',
+        help="Raw frame files in frame order, or a directory of frame files")
+    parser_import.add_argument(
+        '--width', type=int, required=True, help="Frame width")
+    parser_import.add_argument(
+        '--height', type=int, required=True, help="Frame height")
+    parser_import.add_argument(
+        '--bits', type=int, default=24, help="Bits per pixel")
+    parser_import.add_argument(
+        '--channels', type=int, default=3, help="Number of channels")
+    parser_import.add_argument(
+        '--fps', type=float, default=25.0, help="Frame rate")
+    parser_import.add_argument(
+        '--writers', '-w', type=int, default=4,
+        help="Number of frames written concurrently")
+    parser_import.add_argument(
+        '--in-flight', type=int,
+        help="Maximum number of frames read and not yet written (default: twice the writers)")
+    parser_import.add_argument(
+        '--journal',
+        help="File recording written frames to resume an interrupted import "
+             "(default: .<name>.wiretap-import next to the frames)")
+    parser_import.add_argument(
+        '--no-resume', dest='resume', action='store_false',
+        help="Ignore the journal of a previous import and create a new clip")
+    parser_import.add_argument(
+        '--frame-stats', type=argparse.FileType('w'),
+        help="Write the size and write duration of each frame to a CSV file")
+
+    parser_watch = sub_parser.add_parser(
+        'watch',
+        help="Print nodes created and deleted as JSON lines")
+    parser_watch.add_argument(
+        'paths', nargs='*', default=['/projects', '/users'],
+        help="Nodes to watch (default: /projects /users)")
+    parser_watch.add_argument(
+        '--depth', type=int, default=1,
+        help="How deep to watch, ex: 4 for the libraries of projects")
+    parser_watch.add_argument(
+        '--min-interval', type=float, default=2.0,
+        help="Delay in seconds between polls after a change")
+    parser_watch.add_argument(
+        '--max-interval', type=float, default=60.0,
+        help="Longest delay in seconds between polls while nothing changes")
+    parser_watch.add_argument(
+        '--verify-every', type=int, default=10,
+        help="List all nodes every this number of polls, instead of comparing child counts")
+    parser_watch.add_argument(
+        '--polls', type=int,
+        help="Stop after this number of polls")
+    parser_watch.add_argument(
+        '--workers', '-w', type=int, default=8,
+        help="Number of nodes polled concurrently on each server")
+
+    # snapshot
+    parser_dump = sub_parser.add_parser(
+        'dump',
+        help="Save the Wiretap database to a snapshot file")
+    parser_dump.add_argument(
+        'output', help="Snapshot file, compressed if it ends with .gz, - for standard output")
+    parser_dump.add_argument(
+        '--path', default='/', help="Path of the node to start from")
+    parser_dump.add_argument(
+        '--depth', '-d', type=int, help="Maximum depth to crawl")
+    parser_dump.add_argument(
+        '--compress', '-z', action='store_true', help="Compress the snapshot with gzip")
+    parser_dump.add_argument(
+        '--no-metadata', dest='metadata', action='store_false',
+        help="Do not save project settings")
+    parser_dump.add_argument(
+        '--workers', '-w', type=int, default=8,
+        help="Number of nodes listed concurrently")
+
+    parser_diff = sub_parser.add_parser(
+        'diff',
+        help="Compare two snapshot files")
+    parser_diff.add_argument(
+        'old', help="First snapshot file")
+    parser_diff.add_argument(
+        'new', help="Second snapshot file")
 
     # user
     parser_listuser = sub_parser.add_parser(
@@ -77,7 +379,13 @@ def parse_args(args):
         'create-user',
         help="Create a Wiretap user")
     parser_createuser.add_argument(
-        'name', help="Flame User name")
+        'name', nargs='*', help="Flame User name")
+    parser_createuser.add_argument(
+        '--names-file', type=argparse.FileType('r'),
+        help="File with one Flame User name per line")
+    parser_createuser.add_argument(
+        '--workers', '-w', type=int, default=8,
+        help="Number of nodes created concurrently")
 
     parser_deleteuser = sub_parser.add_parser(
         'delete-user',
@@ -85,15 +393,390 @@ def parse_args(args):
     parser_deleteuser.add_argument(
         'name', help="Flame User name")
 
+    # batch
+    parser_batch = sub_parser.add_parser(
+        'batch',
+        help="Run operations read from a JSON Lines or YAML file")
+    parser_batch.add_argument(
+        'file', type=argparse.FileType('r'),
+        help="File of operations, - for the standard input")
+    parser_batch.add_argument(
+        '--format', default='auto', choices=['auto', 'jsonl', 'yaml'],
+        help="Format of the file, auto tries JSON Lines then YAML")
+    parser_batch.add_argument(
+        '--workers', '-w', type=int, default=8,
+        help="Number of operations run concurrently")
+
+    # daemon
+    parser_serve = sub_parser.add_parser(
+        'serve',
+        help="Run a daemon keeping connections open for other invocations")
+    parser_serve.add_argument(
+        '--cache-ttl', type=float, default=daemon.DEFAULT_CACHE_TTL,
+        help="Lifetime in seconds of cached nodes and project settings")
+
     return parser.parse_args(args)
 
 
+def read_names(names_file):
+    """
+    Read names from a file, one per line. Blank lines and lines starting with # are ignored.
+    """
+    names = []
+    for line in names_file:
+        line = line.strip()
+        if line and not line.startswith('#'):
+            names.append(line)
+    return names
+
+
+def get_names(args, hostname, path):
+    """
+    List the names of the children of a node, from the disk cache if --max-age allows it.
+    """
+    cache = diskcache.DiskCache(args.cache_dir)
+    if args.max_age is not None:
+        names = cache.get(hostname, path, args.max_age)
+        if names is not None:
+            return names
+
+    fetched_at = time.time()
+    names = execute(args, hostname, LISTINGS[path])
+    if args.max_age is not None:
+        cache.set(hostname, path, names, fetched_at)
+    return names
+
+
+def execute(args, hostname, operation, **params):
+    """
+    Run an operation through the daemon if one is running, directly otherwise.
+    """
+    if getattr(args, 'daemon', True):
+        try:
+            return daemon.request(args.socket, hostname, operation, params, backend_name=args.backend)
+        except daemon.DaemonUnavailable as e:
+            logger.debug("%s, connect directly", e)
+            args.daemon = False
+
+    with wiretap.WiretapHandler(hostname=hostname) as handler:
+        return operations.run(handler, operation, params)
+
+
+def invalidate(args, path):
+    """
+    Drop disk cache entries of a node modified by a command
+    """
+    diskcache.DiskCache(args.cache_dir).invalidate(args.server, path)
+
+
+def list_fleet(hosts, args, path, what):
+    """
+    Query many servers concurrently and print names tagged by server.
+
+    :return: False if a server could not be queried
+    :rtype: bool
+    """
+    def query(hostname):
+        return get_names(args, hostname, path)
+
+    failures = 0
+    for result in fleet.fan_out(hosts, query, parallel=args.parallel, timeout=args.timeout):
+        if not result.ok:
+            failures += 1
+            logger.error("%s: unreachable (%s)", result.hostname, result.error)
+        elif result.value:
+            for name in result.value:
+                print "%s: %s" % (result.hostname, name)
+        else:
+            print "%s: No %s found in database..." % (result.hostname, what)
+
+    if failures:
+        logger.error("%d/%d servers could not be queried", failures, len(hosts))
+    return failures == 0
+
+
+def run_batch(args, batch_operations):
+    """
+    Run operations over one handler, printing results as JSON lines as they
+    complete and a summary of the failures at the end.
+
+    :return: False if an operation failed
+    :rtype: bool
+    """
+    start = time.time()
+    failures = []
+    handler = wiretap.WiretapHandler(hostname=args.server)
+    try:
+        for result in batch.run(handler, batch_operations, workers=args.workers):
+            print json.dumps(result.to_dict(), sort_keys=True)
+            sys.stdout.flush()
+            if not result.ok:
+                failures.append(result)
+    finally:
+        handler.close()
+        invalidate(args, '/projects')
+        invalidate(args, '/users')
+
+    logger.info("%d operation(s) run in %.1fs, %d failed." % (len(batch_operations), time.time() - start, len(failures)))
+    for result in sorted(failures, key=lambda r: r.index):
+        logger.error("#%d %s %s: %s" % (result.index, result.operation['op'], result.operation['name'], result.error))
+    return not failures
+
+
+def parse_frame_range(frame_range):
+    """
+    Parse a frame range like 10-20, 10- or 10
+
+    :return: first and last frames, None when not given
+    :rtype: tuple
+    """
+    if not frame_range:
+        return None, None
+    first, sep, last = frame_range.partition('-')
+    try:
+        first = int(first) if first else None
+        last = int(last) if last else (None if sep else first)
+    except ValueError:
+        sys.exit("Invalid frame range: %s" % frame_range)
+    return first, last
+
+
+def frame_files(sources):
+    """
+    List frame files, directories being replaced by their sorted files
+    """
+    files = []
+    for source in sources:
+        if os.path.isdir(source):
+            files.extend(
+                os.path.join(source, name) for name in sorted(os.listdir(source))
+                if not name.startswith('.') and os.path.isfile(os.path.join(source, name)))
+        else:
+            files.append(source)
+    return files
+
+
+def watch_hosts(hosts, args):
+    """
+    Watch servers concurrently, printing their events as JSON lines
+
+    :return: False if a server could not be watched
+    :rtype: bool
+    """
+    events = Queue.Queue()
+
+    def watch(hostname):
+        try:
+            with wiretap.WiretapHandler(hostname=hostname) as handler:
+                watcher = handler.watcher(
+                    args.paths, max_depth=args.depth, min_interval=args.min_interval,
+                    max_interval=args.max_interval, verify_every=args.verify_every, workers=args.workers)
+                for event in watcher.run(polls=args.polls):
+                    events.put(event)
+        except Exception as e:
+            logger.error("%s: unable to watch (%s)", hostname, e)
+            events.put(False)
+        else:
+            events.put(True)
+
+    for hostname in hosts:
+        thread = threading.Thread(target=watch, args=(hostname,), name='watch-%s' % hostname)
+        thread.daemon = True
+        thread.start()
+
+    running = len(hosts)
+    ok = True
+    while running:
+        try:
+            # a timeout keeps the main thread interruptible
+            event = events.get(timeout=1)
+        except Queue.Empty:
+            continue
+        if isinstance(event, bool):
+            running -= 1
+            ok = ok and event
+        else:
+            print json.dumps(event, sort_keys=True)
+            sys.stdout.flush()
+    return ok
+
+
+def clone_to_hosts(args):
+    """
+    Read a project on the source server and clone it to the destination servers
+
+    :return: False if a server could not be cloned to
+    :rtype: bool
+    """
+    destinations = fleet.parse_hosts(args.to, args.to_file)
+    if not destinations:
+        sys.exit("No destination server given...")
+
+    start = time.time()
+    with wiretap.WiretapHandler(hostname=args.server) as handler:
+        layout = clone.read_project_layout(handler, args.name)
+    logger.info("Read %s from %s: %d libraries and folders in %.2fs" % (
+        args.name, args.server, layout.count(), time.time() - start))
+
+    failures = 0
+    results = clone.clone_project(
+        layout, destinations, project_name=args.new_name, workers=args.workers,
+        parallel=args.parallel, timeout=args.host_timeout, dry_run=args.dry_run)
+    for (done, result) in enumerate(results, 1):
+        progress = "[%d/%d] %s" % (done, len(destinations), result.hostname)
+        if not result.ok:
+            failures += 1
+            logger.error("%s: failed after %.2fs (%s)" % (progress, result.elapsed, result.error))
+        elif args.dry_run:
+            if result.value['created']:
+                print "%s: + %s [%s]" % (result.hostname, args.new_name or args.name, wiretap.WiretapNodeType.Project)
+            for location in result.value['nodes']:
+                print "%s: + %s" % (result.hostname, location)
+        else:
+            diskcache.DiskCache(args.cache_dir).invalidate(result.hostname, '/projects')
+            logger.info("%s: %s, %d node(s) created in %.2fs" % (
+                progress, "project created" if result.value['created'] else "project updated",
+                len(result.value['nodes']), result.elapsed))
+
+    if failures:
+        logger.error("%d/%d servers could not be cloned to", failures, len(destinations))
+    return failures == 0
+
+
+def parse_settings(args):
+    """
+    Build the settings to change from update-projects arguments
+
+    :rtype: dict
+    """
+    settings = dict()
+    for setting in args.settings:
+        if '=' not in setting:
+            sys.exit("Invalid setting %s, expected KEY=VALUE..." % setting)
+        key, value = setting.split('=', 1)
+        settings[key.strip()] = value
+    if args.setupdir is not None:
+        settings['SetupDir'] = args.setupdir
+    if args.description is not None:
+        settings['Description'] = args.description
+    for key in args.unset:
+        settings[key] = None
+    if not settings:
+        sys.exit("No setting to change, use --set or --unset...")
+    return settings
+
+
+def update_projects(args):
+    """
+    Change settings of projects and print the changes with a summary
+
+    :return: False if a project could not be updated
+    :rtype: bool
+    """
+    results = execute(
+        args, args.server, 'update-projects', pattern=args.pattern, settings=parse_settings(args),
+        regex=args.regex, ignore_case=args.ignore_case, workers=args.workers, dry_run=args.dry_run)
+    if not results:
+        print "No project matches %s..." % args.pattern
+        return True
+
+    changed = unchanged = failed = 0
+    for result in results:
+        if result['error'] is not None:
+            failed += 1
+            logger.error("%s: %s", result['name'], result['error'])
+        elif result['changes']:
+            changed += 1
+            for (key, (old, new)) in sorted(result['changes'].items()):
+                print "%s: %s: %s -> %s" % (result['name'], key, old, new)
+        else:
+            unchanged += 1
+    print "%d project(s) %s, %d unchanged, %d failed" % (
+        changed, "to change" if args.dry_run else "changed", unchanged, failed)
+    return failed == 0
+
+
+def print_settings(names, settings, output_format):
+    """
+    Print project settings as text, JSON or CSV. Projects whose settings
+    could not be read are skipped.
+    """
+    names = [name for name in names if settings.get(name) is not None]
+
+    if output_format == 'json':
+        print json.dumps(
+            dict((name, settings[name]) for name in names), indent=2, sort_keys=True)
+
+    elif output_format == 'csv':
+        keys = sorted(set(key for name in names for key in settings[name]))
+        writer = csv.writer(sys.stdout)
+        writer.writerow(['Project'] + keys)
+        for name in names:
+            writer.writerow([name] + [settings[name].get(key, '') for key in keys])
+
+    else:
+        for name in names:
+            print "%s:" % name
+            for key in sorted(settings[name]):
+                print "  %s: %s" % (key, settings[name][key])
+
+
+def write_stats(args, stats):
+    if args.stats:
+        sys.stderr.write(stats.report() + "\n")
+    if args.prometheus:
+        stats.write_prometheus(args.prometheus, labels={'command': args.command_name})
+    if args.trace:
+        stats.write_chrome_trace(args.trace)
+
+
+def log_to_stderr():
+    """
+    Move log handlers writing to the standard output to the error output
+    """
+    for handler in logging.getLogger().handlers:
+        if isinstance(handler, logging.StreamHandler) and handler.stream is sys.stdout:
+            handler.stream = sys.stderr
+
+
 def main(args):
     args = parse_args(args)
+    backend.use_backend(args.backend)
+    if args.command_name in STDOUT_COMMANDS and args.output == '-':
+        # keep the standard output for the data
+        log_to_stderr()
 
-    if args.command_name == 'list-project':
-        handler = wiretap.WiretapHandler(hostname=args.server)
-        projects = handler.get_projects()
+    if not (args.stats or args.prometheus or args.trace):
+        run_command(args)
+        return
+
+    # calls made by a daemon would not be recorded
+    args.daemon = False
+    stats = instrument.Stats(trace=bool(args.trace))
+    backend.instrument(stats)
+    try:
+        run_command(args)
+    finally:
+        backend.instrument(None)
+        write_stats(args, stats)
+
+
+def run_command(args):
+    hosts = fleet.parse_hosts(getattr(args, 'server', None), args.server_file) or ['localhost']
+    if len(hosts) > 1 and args.command_name not in FLEET_COMMANDS:
+        sys.exit("Command %s only accepts a single server..." % args.command_name)
+    args.server = hosts[0]
+
+    if args.command_name == 'list-project' and len(hosts) > 1:
+        if not list_fleet(hosts, args, '/projects', 'project'):
+            sys.exit(1)
+
+    elif args.command_name == 'list-user' and len(hosts) > 1:
+        if not list_fleet(hosts, args, '/users', 'User'):
+            sys.exit(1)
+
+    elif args.command_name == 'list-project':
+        projects = get_names(args, args.server, '/projects')
 
         if projects:
             print "Projects found:"
@@ -103,6 +786,7 @@ def main(args):
             print "No project found in database..."
 
     elif args.command_name == 'create-project':
+        placement.use_counters(diskcache.DiskCache(args.cache_dir))
         project_setings = {
             'FrameWidth': args.width,
             'FrameHeight': args.height,
@@ -115,9 +799,6 @@ def main(args):
         if args.setupdir:
             project_setings['SetupDir'] = args.setupdir
 
-        handler = wiretap.WiretapHandler(hostname=args.server)
-        project = handler.create_project(args.name, project_setings)
-
         libs = dict()
         if args.libraries_file:
             try:
@@ -125,13 +806,142 @@ def main(args):
             except Exception:
                 pass
 
-        if libs:
-            for lib in libs.keys():
-                handler._create_project_librairies(project, lib, libs[lib])
+        if args.dry_run:
+            handler = wiretap.WiretapHandler(hostname=args.server)
+            project = handler.get_project(args.name)
+            if project is None:
+                volume = handler.choose_volume(placement=args.placement, volume=args.volume, dry_run=True)
+                print "+ %s [%s] on %s" % (args.name, wiretap.WiretapNodeType.Project, volume)
+            for lib in (libs or {}).keys():
+                plan = handler.plan_project_libraries(project, lib, libs[lib])
+                for (location, node_type) in plan:
+                    print "+ %s/%s [%s]" % (args.name, location, node_type)
+            return
 
-    elif args.command_name == 'list-user':
+        try:
+            execute(
+                args, args.server, 'create-project', name=args.name, settings=project_setings,
+                libraries=libs, workers=args.workers, volume=args.volume, placement=args.placement)
+        except wiretap.WiretapException as e:
+            logger.error(e)
+            sys.exit(1)
+        finally:
+            invalidate(args, '/projects')
+
+    elif args.command_name == 'clone-project':
+        try:
+            if not clone_to_hosts(args):
+                sys.exit(1)
+        except wiretap.WiretapException as e:
+            logger.error(e)
+            sys.exit(1)
+
+    elif args.command_name == 'update-projects':
+        if not update_projects(args):
+            sys.exit(1)
+
+    elif args.command_name == 'project-info':
+        projects = execute(args, args.server, 'project-info', names=args.name, workers=args.workers)
+        names = [name for (name, _) in projects]
+        settings = dict(projects)
+        print_settings(names, settings, args.format)
+        if None in settings.values():
+            sys.exit(1)
+
+    elif args.command_name == 'tree':
+        handler = wiretap.WiretapHandler(hostname=args.server)
+        nodes = handler.walk(
+            args.path, max_depth=args.depth, node_types=args.node_types, with_depth=True)
+        for (path, name, node_type, depth) in nodes:
+            if args.node_types:
+                # filtered nodes are not nested, print where they are
+                print "%s [%s] %s" % (name, node_type, path)
+            else:
+                print "%s%s [%s]" % ('    ' * (depth - 1), name, node_type)
+            sys.stdout.flush()
+
+    elif args.command_name == 'find':
         handler = wiretap.WiretapHandler(hostname=args.server)
-        users = handler.get_users()
+        nodes = handler.find(
+            args.pattern, path=args.path, node_types=args.node_types, regex=args.regex,
+            ignore_case=args.ignore_case, limit=args.limit, max_depth=args.depth, workers=args.workers)
+        found = 0
+        for (path, name, node_type, location) in nodes:
+            found += 1
+            print "%s [%s]" % (location, node_type)
+            sys.stdout.flush()
+        if not found:
+            sys.exit(1)
+
+    elif args.command_name == 'export-clip':
+        first, last = parse_frame_range(args.frame_range)
+        handler = wiretap.WiretapHandler(hostname=args.server)
+        try:
+            stats = export.export_clip(
+                handler, args.path, args.output, first=first, last=last,
+                readers=args.readers, buffers=args.buffers)
+        except wiretap.WiretapException as e:
+            logger.error(e)
+            sys.exit(1)
+        # keep the standard output for frames
+        sys.stderr.write("Exported %s\n" % stats)
+
+    elif args.command_name == 'import-frames':
+        files = frame_files(args.sources)
+        if not files:
+            sys.exit("No frame file found...")
+        journal = args.journal or os.path.join(
+            os.path.dirname(os.path.abspath(files[0])), '.%s.wiretap-import' % args.name)
+        if not args.resume and os.path.exists(journal):
+            os.remove(journal)
+
+        handler = wiretap.WiretapHandler(hostname=args.server)
+        clip_format = ingest.make_clip_format(args.width, args.height, args.bits, args.channels, args.fps)
+        try:
+            stats = ingest.import_frames(
+                handler, args.path, args.name, files, clip_format,
+                writers=args.writers, in_flight=args.in_flight, journal=journal)
+        except wiretap.WiretapException as e:
+            logger.error(e)
+            sys.exit(1)
+        logger.info("Imported %s into %s" % (stats, stats.clip_path))
+        if args.frame_stats:
+            writer = csv.writer(args.frame_stats)
+            writer.writerow(['frame', 'bytes', 'seconds'])
+            for (frame_idx, size, duration) in sorted(stats.frame_times):
+                writer.writerow([frame_idx, size, '%.6f' % duration])
+            args.frame_stats.close()
+
+    elif args.command_name == 'watch':
+        if not watch_hosts(hosts, args):
+            sys.exit(1)
+
+    elif args.command_name == 'dump':
+        handler = wiretap.WiretapHandler(hostname=args.server)
+        output = snapshot.open_snapshot(args.output, 'w', compress=args.compress or None)
+        try:
+            summary = snapshot.dump(
+                handler, output, path=args.path, workers=args.workers,
+                metadata=args.metadata, max_depth=args.depth)
+        finally:
+            if output is not sys.stdout:
+                output.close()
+        logger.info("%(nodes)d nodes saved in %(seconds).1fs (%(errors)d errors)" % summary)
+        if summary['errors']:
+            sys.exit(1)
+
+    elif args.command_name == 'diff':
+        old = snapshot.open_snapshot(args.old)
+        new = snapshot.open_snapshot(args.new)
+        differences = 0
+        for (change, path, node_type) in snapshot.diff(old, new):
+            differences += 1
+            print "%s %s [%s]" % (change, path, node_type)
+        if differences:
+            sys.exit(1)
+
+    elif args.command_name == 'list-user':
+        users = get_names(args, args.server, '/users')
         if users:
             print "Users found:"
             for u in users:
@@ -140,12 +950,37 @@ def main(args):
             print "No User found in database..."
 
     elif args.command_name == 'create-user':
-        handler = wiretap.WiretapHandler(hostname=args.server)
-        handler.create_user(args.name)
+        names = list(args.name)
+        if args.names_file:
+            names.extend(read_names(args.names_file))
+        if not names:
+            sys.exit("No user name given...")
+
+        try:
+            execute(args, args.server, 'create-user', names=names, workers=args.workers)
+        except BulkCreateError as e:
+            logger.error(e)
+            sys.exit(1)
+        finally:
+            invalidate(args, '/users')
 
     elif args.command_name == 'delete-user':
-        handler = wiretap.WiretapHandler(hostname=args.server)
-        handler.delete_user(args.name)
+        try:
+            execute(args, args.server, 'delete-user', name=args.name)
+        finally:
+            invalidate(args, '/users')
+
+    elif args.command_name == 'batch':
+        try:
+            batch_operations = batch.load(args.file, args.format)
+        except wiretap.WiretapException as e:
+            sys.exit(str(e))
+        if not run_batch(args, batch_operations):
+            sys.exit(1)
+
+    elif args.command_name == 'serve':
+        placement.use_counters(diskcache.DiskCache(args.cache_dir))
+        daemon.serve(args.socket, cache_ttl=args.cache_ttl)
 
 
 def run():
@@ -0,0 +1,168 @@
+# coding: utf-8
+"""
+Replication of a project to other servers.
+
+The source project is read once: its XML metadata and the libraries and
+folders of each of its library lists. The layout is then applied to every
+destination server concurrently, only the missing nodes being created.
+"""
+
+import time
+import logging
+
+import fleet
+from wiretap import WiretapHandler, WiretapException, WiretapNodeType
+
+
+logger = logging.getLogger(__name__)
+
+LAYOUT_TYPES = (WiretapNodeType.LibraryList, WiretapNodeType.Library, WiretapNodeType.Folder)
+
+
+class ProjectLayout(object):
+    """Settings and library structure of a project"""
+
+    def __init__(self, name, xml, libraries):
+        """
+
+        :param name: name of the project
+        :type name: string
+        :param xml: XML metadata of the project
+        :type xml: string
+        :param libraries: layout of each library list, ex: {'Libraries': {'EDIT': {'CONFORM': None}}}
+        :type libraries: dict
+        """
+        self.name = name
+        self.xml = xml
+        self.libraries = libraries
+
+    def count(self):
+        """
+        Number of libraries and folders
+        """
+        def count(layout):
+            return sum(1 + count(children) for children in (layout or {}).values())
+        return sum(count(layout) for layout in self.libraries.values())
+
+
+def read_project_layout(handler, project_name):
+    """
+    Read the settings and the library structure of a project
+
+    :param handler: handler connected to the source server
+    :type handler: WiretapHandler
+    :param project_name: name of the project
+    :type project_name: string
+    :rtype: ProjectLayout
+    :raises WiretapException: if the project can't be read
+    """
+    project = handler.get_project(project_name)
+    if project is None:
+        raise WiretapException("Project %s not found on %s" % (project_name, handler.hostname))
+    xml = handler.get_project_xml(project_name)
+
+    libraries = dict()
+    # (depth, children of the node) from the library list to the current node
+    stack = []
+    nodes = handler.walk(handler._node_path(project), node_types=LAYOUT_TYPES, with_depth=True)
+    for (_, name, node_type, depth) in nodes:
+        while stack and stack[-1][0] >= depth:
+            stack.pop()
+        if node_type == WiretapNodeType.LibraryList:
+            children = libraries.setdefault(name, dict())
+            stack = [(depth, children)]
+            continue
+        if not stack:
+            # libraries outside of a library list are not cloned
+            continue
+        children = stack[-1][1].setdefault(name, dict())
+        stack.append((depth, children))
+    return ProjectLayout(project_name, xml, libraries)
+
+
+def _library_list(handler, project, library_name):
+    """
+    Find a library list of a project, creating it in the workspace if missing
+    """
+    library_list = handler._get_node(project, library_name, WiretapNodeType.LibraryList)
+    if library_list is not None:
+        return library_list
+    workspace = handler._get_node(project, 'Workspace', WiretapNodeType.Workspace)
+    return handler._create_node(workspace or project, WiretapNodeType.LibraryList, library_name)
+
+
+def apply_project_layout(handler, layout, project_name=None, workers=8, dry_run=False):
+    """
+    Create a project and its libraries and folders, or the ones it lacks
+
+    :param handler: handler connected to the destination server
+    :type handler: WiretapHandler
+    :param layout: layout read from the source project
+    :type layout: ProjectLayout
+    :param project_name: name of the destination project, the source name by default
+    :type project_name: string
+    :param workers: maximum number of nodes created concurrently
+    :type workers: int
+    :param dry_run: only compute the nodes to create
+    :type dry_run: bool
+    :return: whether the project was created and the nodes created, or to create on a dry run
+    :rtype: dict
+    :raises BulkCreateError: if some nodes can't be created
+    """
+    project_name = project_name or layout.name
+    project = handler.get_project(project_name)
+    created = project is None
+    nodes = []
+
+    if dry_run:
+        for (library_name, libraries) in sorted(layout.libraries.items()):
+            planned_project = project
+            if project is not None and handler._get_node(project, library_name, WiretapNodeType.LibraryList) is None:
+                # every node of a missing library list is created
+                planned_project = None
+            plan = handler.plan_project_libraries(planned_project, library_name, libraries)
+            nodes.extend("%s/%s" % (project_name, location) for (location, _) in plan)
+        return {'created': created, 'nodes': nodes}
+
+    if created:
+        project = handler.create_project(project_name)
+        handler.set_project_xml(project_name, layout.xml)
+        logger.info("%s: project %s created", handler.hostname, project_name)
+
+    for (library_name, libraries) in sorted(layout.libraries.items()):
+        _library_list(handler, project, library_name)
+        plan = handler._create_project_librairies(project, library_name, libraries, workers=workers)
+        nodes.extend("%s/%s" % (project_name, location) for (location, _) in plan)
+        logger.info("%s: %d node(s) created in %s", handler.hostname, len(plan), library_name)
+    return {'created': created, 'nodes': nodes}
+
+
+def clone_project(layout, hostnames, project_name=None, workers=8, parallel=16, timeout=None, dry_run=False):
+    """
+    Replicate a project to many servers concurrently
+
+    :param layout: layout read from the source project
+    :type layout: ProjectLayout
+    :param hostnames: destination servers
+    :type hostnames: list
+    :param project_name: name of the destination project, the source name by default
+    :type project_name: string
+    :param workers: maximum number of nodes created concurrently on each server
+    :type workers: int
+    :param parallel: maximum number of servers written at the same time
+    :type parallel: int
+    :param timeout: maximum duration in seconds of the clone on each server
+    :type timeout: float
+    :param dry_run: only compute the nodes to create
+    :type dry_run: bool
+    :return: a HostResult per server, valued with the outcome of apply_project_layout, in completion order
+    :rtype: generator
+    """
+    def clone(hostname):
+        start = time.time()
+        with WiretapHandler(hostname=hostname) as handler:
+            result = apply_project_layout(handler, layout, project_name, workers=workers, dry_run=dry_run)
+        logger.debug("%s: cloned in %.2fs", hostname, time.time() - start)
+        return result
+
+    return fleet.fan_out(hostnames, clone, parallel=parallel, timeout=timeout)
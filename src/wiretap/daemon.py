@@ -0,0 +1,258 @@
+# coding: utf-8
+"""
+Long-lived process keeping Wiretap connections and node caches warm for the
+command line tool.
+
+The daemon listens on a Unix socket. Requests and responses are JSON
+objects, one per line, several of them can be sent on a connection:
+
+    {"id": 1, "server": "flame01", "op": "list-project", "params": {}, "backend": "native"}
+    {"id": 1, "result": ["project_a", "project_b"]}
+    {"id": 1, "error": "Unable to delete user: ...", "failures": null}
+
+Requests for a same server run one at a time on a shared handler, requests
+for different servers run concurrently.
+"""
+
+import os
+import sys
+import json
+import time
+import errno
+import signal
+import socket
+import logging
+import tempfile
+import threading
+import SocketServer
+
+import backend
+import operations
+from wiretap import WiretapHandler, WiretapException
+from bulk import BulkCreateError
+
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SOCKET = os.environ.get('WIRETAP_SOCKET') or os.path.join(
+    os.environ.get('XDG_RUNTIME_DIR') or tempfile.gettempdir(), 'wiretap-%d.sock' % os.getuid())
+DEFAULT_CACHE_TTL = 30
+# seconds to wait for a daemon to accept a connection, and to answer a request
+CONNECT_TIMEOUT = 2.0
+DEFAULT_TIMEOUT = 600.0
+
+
+class DaemonUnavailable(Exception):
+    """Raised when no daemon can run a request, which should be run directly"""
+    pass
+
+
+class _HostEntry(object):
+    """Handler of a server and the lock serializing its requests"""
+
+    def __init__(self, handler):
+        self.handler = handler
+        self.lock = threading.Lock()
+        self.cleared = time.time()
+
+
+class _RequestHandler(SocketServer.StreamRequestHandler):
+
+    def handle(self):
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                break
+            response = self.server.dispatch(line)
+            self.wfile.write(json.dumps(response) + "\n")
+
+
+class WiretapDaemon(SocketServer.ThreadingMixIn, SocketServer.UnixStreamServer):
+    """
+    Server running operations on behalf of command line tool invocations
+    """
+
+    daemon_threads = True
+
+    def __init__(self, path=DEFAULT_SOCKET, cache_ttl=DEFAULT_CACHE_TTL):
+        """
+
+        :param path: path of the Unix socket
+        :type path: string
+        :param cache_ttl: lifetime in seconds of cached nodes and project settings
+        :type cache_ttl: float
+        """
+        self.path = path
+        self.cache_ttl = cache_ttl
+        self.started = time.time()
+        self._hosts = dict()
+        self._hosts_lock = threading.Lock()
+
+        if os.path.exists(path):
+            if is_running(path):
+                raise WiretapException("A daemon is already listening on %s" % path)
+            os.remove(path)
+
+        umask = os.umask(0o077)
+        try:
+            SocketServer.UnixStreamServer.__init__(self, path, _RequestHandler)
+        finally:
+            os.umask(umask)
+
+    def _host(self, hostname):
+        with self._hosts_lock:
+            entry = self._hosts.get(hostname)
+            if entry is None:
+                logger.info("Connect to %s", hostname)
+                entry = self._hosts[hostname] = _HostEntry(WiretapHandler(hostname, cache_ttl=self.cache_ttl))
+        return entry
+
+    def dispatch(self, line):
+        """
+        Run a request
+
+        :param line: JSON encoded request
+        :type line: string
+        :return: response
+        :rtype: dict
+        """
+        try:
+            request = json.loads(line)
+        except ValueError as e:
+            return {'id': None, 'error': "Invalid request: %s" % e}
+        request_id = request.get('id')
+        operation = request.get('op')
+
+        if operation == 'ping':
+            with self._hosts_lock:
+                servers = sorted(self._hosts.keys())
+            return {'id': request_id, 'result': {
+                'pid': os.getpid(), 'uptime': time.time() - self.started,
+                'backend': backend.current_backend(), 'servers': servers}}
+
+        if request.get('backend', backend.current_backend()) != backend.current_backend():
+            return {'id': request_id, 'unavailable': "Daemon uses the %s backend" % backend.current_backend()}
+
+        hostname = request.get('server') or 'localhost'
+        start = time.time()
+        try:
+            entry = self._host(hostname)
+            with entry.lock:
+                if start - entry.cleared > self.cache_ttl:
+                    entry.handler.clear_cache()
+                    entry.cleared = start
+                result = operations.run(entry.handler, operation, request.get('params'))
+        except Exception as e:
+            logger.error("%s %s failed: %s", hostname, operation, e)
+            failures = e.failures if isinstance(e, BulkCreateError) else None
+            return {'id': request_id, 'error': str(e), 'failures': failures}
+        logger.debug("%s %s done in %.3fs", hostname, operation, time.time() - start)
+        return {'id': request_id, 'result': result}
+
+    def close(self):
+        """
+        Stop listening and close all handlers
+        """
+        self.server_close()
+        if os.path.exists(self.path):
+            os.remove(self.path)
+        with self._hosts_lock:
+            hosts, self._hosts = self._hosts, dict()
+        for entry in hosts.values():
+            entry.handler.close()
+
+
+def serve(path=DEFAULT_SOCKET, cache_ttl=DEFAULT_CACHE_TTL):
+    """
+    Run a daemon until interrupted or terminated
+
+    :param path: path of the Unix socket
+    :type path: string
+    :param cache_ttl: lifetime in seconds of cached nodes and project settings
+    :type cache_ttl: float
+    """
+    server = WiretapDaemon(path, cache_ttl=cache_ttl)
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    logger.info("Listening on %s", path)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.close()
+
+
+def _connect(path):
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    sock.settimeout(CONNECT_TIMEOUT)
+    try:
+        sock.connect(path)
+    except socket.timeout:
+        sock.close()
+        raise DaemonUnavailable("Daemon on %s did not accept the connection" % path)
+    except socket.error as e:
+        sock.close()
+        if e.errno in (errno.ENOENT, errno.ECONNREFUSED, errno.EACCES):
+            raise DaemonUnavailable("No daemon listening on %s" % path)
+        raise
+    return sock
+
+
+def is_running(path=DEFAULT_SOCKET):
+    """
+    Tell whether a daemon listens on a socket
+    """
+    try:
+        _connect(path).close()
+    except (DaemonUnavailable, socket.error):
+        return False
+    return True
+
+
+def request(path, hostname, operation, params=None, backend_name=None, timeout=DEFAULT_TIMEOUT):
+    """
+    Run an operation through the daemon
+
+    :param path: path of the Unix socket
+    :type path: string
+    :param hostname: Wiretap server
+    :type hostname: string
+    :param operation: name of the operation, ex: 'list-project'
+    :type operation: string
+    :param params: parameters of the operation
+    :type params: dict
+    :param backend_name: backend the caller expects the daemon to use
+    :type backend_name: string
+    :param timeout: seconds to wait for the result, None to wait as long as it takes
+    :type timeout: float
+    :return: result of the operation
+    :raises DaemonUnavailable: if no daemon can run the request
+    :raises BulkCreateError: if some nodes could not be created
+    :raises WiretapException: if the operation failed or the daemon did not answer in time
+    """
+    sock = _connect(path)
+    try:
+        # the request was sent, retrying it directly could run the operation twice
+        sock.settimeout(timeout)
+        stream = sock.makefile('r+')
+        stream.write(json.dumps({
+            'id': 1, 'server': hostname, 'op': operation, 'params': params or {},
+            'backend': backend_name or backend.current_backend()}) + "\n")
+        stream.flush()
+        line = stream.readline()
+        stream.close()
+    except socket.timeout:
+        raise WiretapException("Daemon did not answer %s within %gs, it may still be running" % (operation, timeout))
+    finally:
+        sock.close()
+
+    if not line:
+        raise WiretapException("Daemon closed the connection running %s" % operation)
+    response = json.loads(line)
+    if 'unavailable' in response:
+        raise DaemonUnavailable(response['unavailable'])
+    if response.get('failures'):
+        raise BulkCreateError([tuple(f) for f in response['failures']], [])
+    if 'error' in response:
+        raise WiretapException(response['error'])
+    return response.get('result')
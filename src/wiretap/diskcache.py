@@ -0,0 +1,187 @@
+# coding: utf-8
+"""
+On-disk cache of read results, shared by concurrent command line invocations.
+
+Entries are JSON files keyed by server and node path. They are replaced
+atomically with a rename, so readers never take a lock. Writers and
+invalidations serialize on a per-server lock file, and an entry read before
+an invalidation is never written after it.
+"""
+
+import os
+import re
+import json
+import time
+import fcntl
+import hashlib
+import logging
+import tempfile
+
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CACHE_DIR = os.environ.get('WIRETAP_CACHE_DIR') or os.path.join(
+    os.environ.get('XDG_CACHE_HOME') or os.path.join('~', '.cache'), 'wiretap')
+
+
+class DiskCache(object):
+
+    def __init__(self, directory=DEFAULT_CACHE_DIR):
+        """
+
+        :param directory: directory holding the cache
+        :type directory: string
+        """
+        self.directory = os.path.expanduser(directory)
+
+    def _server_dir(self, server):
+        return os.path.join(self.directory, re.sub(r'[^A-Za-z0-9._-]', '_', server))
+
+    def _entry_file(self, server, path):
+        return os.path.join(self._server_dir(server), hashlib.sha1(path).hexdigest() + '.json')
+
+    def _read(self, filename):
+        try:
+            with open(filename) as f:
+                return json.load(f)
+        except (IOError, OSError, ValueError):
+            return None
+
+    def _lock(self, server):
+        server_dir = self._server_dir(server)
+        if not os.path.isdir(server_dir):
+            try:
+                os.makedirs(server_dir, 0o700)
+            except OSError:
+                if not os.path.isdir(server_dir):
+                    raise
+        lock_file = open(os.path.join(server_dir, '.lock'), 'a')
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        return lock_file
+
+    def _replace(self, server, path, entry):
+        filename = self._entry_file(server, path)
+        fd, tmp_name = tempfile.mkstemp(dir=os.path.dirname(filename), suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'w') as f:
+                json.dump(entry, f)
+            os.rename(tmp_name, filename)
+        except Exception:
+            if os.path.exists(tmp_name):
+                os.remove(tmp_name)
+            raise
+
+    def get(self, server, path, max_age):
+        """
+        Retrieve a cached value if it is fresh enough
+
+        :param server: Wiretap server
+        :type server: string
+        :param path: path of the node
+        :type path: string
+        :param max_age: maximum age of the value in seconds
+        :type max_age: float
+        :return: the cached value, None if missing or too old
+        """
+        entry = self._read(self._entry_file(server, path))
+        if not entry or 'value' not in entry or entry.get('path') != path:
+            return None
+        if time.time() - entry['time'] > max_age:
+            return None
+        logger.debug("Use cached %s of %s (%.0fs old)", path, server, time.time() - entry['time'])
+        return entry['value']
+
+    def set(self, server, path, value, fetched_at=None):
+        """
+        Store a value read from a server
+
+        :param server: Wiretap server
+        :type server: string
+        :param path: path of the node
+        :type path: string
+        :param value: JSON serializable value
+        :param fetched_at: time the value was read at, the value is dropped if
+            the entry has been invalidated since
+        :type fetched_at: float
+        """
+        fetched_at = fetched_at or time.time()
+        try:
+            lock_file = self._lock(server)
+        except (IOError, OSError) as e:
+            logger.debug("Unable to write cache: %s", e)
+            return
+        try:
+            previous = self._read(self._entry_file(server, path)) or {}
+            if previous.get('path') != path:
+                previous = {}
+            # neither overwrite a value read later nor store one read before an invalidation
+            if previous.get('invalidated', 0) > fetched_at or previous.get('time', 0) > fetched_at:
+                return
+            entry = {'path': path, 'time': fetched_at, 'value': value}
+            if 'invalidated' in previous:
+                entry['invalidated'] = previous['invalidated']
+            self._replace(server, path, entry)
+        except (IOError, OSError) as e:
+            logger.debug("Unable to write cache: %s", e)
+        finally:
+            lock_file.close()
+
+    def invalidate(self, server, path):
+        """
+        Drop the cached value of a node
+
+        :param server: Wiretap server
+        :type server: string
+        :param path: path of the node
+        :type path: string
+        """
+        if not os.path.isdir(self._server_dir(server)):
+            return
+        try:
+            lock_file = self._lock(server)
+        except (IOError, OSError) as e:
+            logger.warning("Unable to invalidate cache: %s", e)
+            return
+        try:
+            self._replace(server, path, {'path': path, 'invalidated': time.time()})
+        except (IOError, OSError) as e:
+            logger.warning("Unable to invalidate cache: %s", e)
+        finally:
+            lock_file.close()
+
+    def peek(self, server, name):
+        """
+        Current value of a counter, without incrementing it
+
+        :param server: Wiretap server
+        :type server: string
+        :param name: name of the counter
+        :type name: string
+        :rtype: int
+        """
+        key = 'counter:%s' % name
+        entry = self._read(self._entry_file(server, key)) or {}
+        return entry.get('value', 0) if entry.get('path') == key else 0
+
+    def increment(self, server, name):
+        """
+        Increment a counter kept with the entries of a server, shared by all
+        invocations
+
+        :param server: Wiretap server
+        :type server: string
+        :param name: name of the counter
+        :type name: string
+        :return: value of the counter before the increment
+        :rtype: int
+        :raises IOError: if the counter can't be written
+        """
+        key = 'counter:%s' % name
+        lock_file = self._lock(server)
+        try:
+            entry = self._read(self._entry_file(server, key)) or {}
+            value = entry.get('value', 0) if entry.get('path') == key else 0
+            self._replace(server, key, {'path': key, 'time': time.time(), 'value': value + 1})
+            return value
+        finally:
+            lock_file.close()
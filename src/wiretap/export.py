@@ -0,0 +1,246 @@
+# coding: utf-8
+"""
+Export of clip frames.
+
+Frames are read concurrently by a pool of reader threads, each with its own
+server handle, into a fixed set of preallocated buffers. A writer thread
+saves them while the next ones are being read. Reading stops when every
+buffer waits to be written, so memory use does not depend on the clip length.
+"""
+
+import sys
+import time
+import Queue
+import logging
+import threading
+from multiprocessing.pool import ThreadPool
+
+from wiretap import WiretapException
+from pool import ThreadServers
+from backend import wt
+
+
+logger = logging.getLogger(__name__)
+
+
+class ExportStats(object):
+    """Outcome of an export"""
+
+    def __init__(self, frames=0, size=0, seconds=0.0):
+        """
+
+        :param frames: number of frames exported
+        :type frames: int
+        :param size: number of bytes written
+        :type size: int
+        :param seconds: duration of the export
+        :type seconds: float
+        """
+        self.frames = frames
+        self.size = size
+        self.seconds = seconds
+
+    @property
+    def fps(self):
+        return self.frames / self.seconds if self.seconds else 0.0
+
+    def __str__(self):
+        return "%d frames (%.1f MB) in %.1fs: %.1f fps, %.1f MB/s" % (
+            self.frames, self.size / 1048576.0, self.seconds, self.fps,
+            self.size / 1048576.0 / self.seconds if self.seconds else 0.0)
+
+
+class FrameBufferPool(object):
+    """
+    Fixed set of frame buffers, allocated once and reused for every frame
+    """
+
+    def __init__(self, count, size):
+        """
+
+        :param count: number of buffers
+        :type count: int
+        :param size: size of each buffer in bytes
+        :type size: int
+        """
+        self.size = size
+        self._free = Queue.Queue()
+        for _ in range(count):
+            self._free.put(bytearray(size))
+
+    def acquire(self):
+        """
+        Take a free buffer, waiting for one to be released if needed
+
+        :rtype: bytearray
+        """
+        return self._free.get()
+
+    def release(self, frame_buffer):
+        self._free.put(frame_buffer)
+
+
+def read_clip_format(handler, clip_path):
+    """
+    Read the format and the number of frames of a clip
+
+    :param handler: handler connected to the server
+    :type handler: WiretapHandler
+    :param clip_path: path of the clip node
+    :type clip_path: string
+    :return: clip format and number of frames
+    :rtype: tuple
+    :raises WiretapException: if the node is not a clip
+    """
+    clip = wt.WireTapNodeHandle(handler._server, clip_path)
+    clip_format = wt.WireTapClipFormat()
+    if not clip.getClipFormat(clip_format):
+        raise WiretapException("Unable to get format of clip %s: %s" % (clip_path, clip.lastError()))
+    num_frames = wt.WireTapInt(0)
+    if not clip.getNumFrames(num_frames):
+        raise WiretapException("Unable to get number of frames of clip %s: %s" % (clip_path, clip.lastError()))
+    return clip_format, int(num_frames)
+
+
+class _FrameWriter(threading.Thread):
+    """
+    Write frames read from a queue, each one to its own file or all of them
+    in order to a single file. Buffers are given back to the pool once written.
+    """
+
+    def __init__(self, output, buffers, first, count):
+        threading.Thread.__init__(self, name='frame-writer')
+        self.daemon = True
+        self.output = output
+        self.buffers = buffers
+        self.frames = Queue.Queue()
+        self.next_frame = first
+        self.last_frame = first + count - 1
+        self.written = 0
+        self.size = 0
+        self.error = None
+        # frames waiting for the previous ones, in single file mode
+        self._pending = dict()
+        self._stream = None
+        if '%' not in output:
+            self._stream = sys.stdout if output == '-' else open(output, 'wb')
+
+    def run(self):
+        while True:
+            item = self.frames.get()
+            if item is None:
+                break
+            frame_idx, frame_buffer = item
+            try:
+                if self.error is None:
+                    self._write(frame_idx, frame_buffer)
+                else:
+                    self.buffers.release(frame_buffer)
+            except Exception as e:
+                self.error = e
+                for pending_buffer in self._pending.values():
+                    self.buffers.release(pending_buffer)
+                self._pending.clear()
+        if self._stream is not None and self._stream is not sys.stdout:
+            self._stream.close()
+
+    def _write(self, frame_idx, frame_buffer):
+        if self._stream is None:
+            with open(self.output % frame_idx, 'wb') as f:
+                self._save(f, frame_buffer)
+            return
+
+        self._pending[frame_idx] = frame_buffer
+        while self.next_frame in self._pending:
+            self._save(self._stream, self._pending.pop(self.next_frame))
+            self.next_frame += 1
+        if self.next_frame > self.last_frame:
+            self._stream.flush()
+
+    def _save(self, f, frame_buffer):
+        try:
+            f.write(frame_buffer)
+            self.written += 1
+            self.size += len(frame_buffer)
+        finally:
+            self.buffers.release(frame_buffer)
+
+
+def export_clip(handler, clip_path, output, first=None, last=None, readers=4, buffers=None):
+    """
+    Export frames of a clip to files
+
+    :param handler: handler connected to the server
+    :type handler: WiretapHandler
+    :param clip_path: path of the clip node
+    :type clip_path: string
+    :param output: file name with a frame number format, ex: 'shot.%04d.raw',
+        to write one file per frame. Otherwise all frames are written in order
+        to this file, - for the standard output
+    :type output: string
+    :param first: first frame to export, from 0
+    :type first: int
+    :param last: last frame to export, included, None for the last frame of the clip
+    :type last: int
+    :param readers: number of frames read at the same time
+    :type readers: int
+    :param buffers: number of frame buffers, twice the readers by default
+    :type buffers: int
+    :rtype: ExportStats
+    :raises WiretapException: if a frame can't be read or written
+    """
+    start = time.time()
+    clip_format, num_frames = read_clip_format(handler, clip_path)
+    first = 0 if first is None else first
+    last = num_frames - 1 if last is None else min(last, num_frames - 1)
+    if first < 0 or first > last:
+        raise WiretapException("Invalid frame range %s-%s for clip %s of %d frames" % (
+            first, last, clip_path, num_frames))
+    count = last - first + 1
+    frame_size = clip_format.frameBufferSize()
+    logger.info("Export %d frames of %dx%d (%d bytes) from %s" % (
+        count, clip_format.width(), clip_format.height(), frame_size, clip_path))
+
+    readers = max(1, min(readers, count))
+    buffers = FrameBufferPool(max(readers + 1, buffers or 2 * readers), frame_size)
+    writer = _FrameWriter(output, buffers, first, count)
+    servers = ThreadServers(handler)
+    local = threading.local()
+    errors = []
+
+    def read_frame(frame_idx, frame_buffer):
+        try:
+            clip = getattr(local, 'clip', None)
+            if clip is None:
+                clip = local.clip = wt.WireTapNodeHandle(servers.get(), clip_path)
+            if not clip.readFrame(frame_idx, frame_buffer, frame_size):
+                raise WiretapException("Unable to read frame %d of %s: %s" % (frame_idx, clip_path, clip.lastError()))
+            writer.frames.put((frame_idx, frame_buffer))
+        except Exception as e:
+            errors.append(e)
+            buffers.release(frame_buffer)
+
+    writer.start()
+    pool = ThreadPool(readers)
+    try:
+        # buffers are taken in frame order, so that the next frame to write
+        # always has one and the writer never waits on a frame which can't be read
+        for frame_idx in range(first, last + 1):
+            frame_buffer = buffers.acquire()
+            if errors or writer.error:
+                buffers.release(frame_buffer)
+                break
+            pool.apply_async(read_frame, (frame_idx, frame_buffer))
+    finally:
+        pool.close()
+        pool.join()
+        servers.release()
+        writer.frames.put(None)
+        writer.join()
+
+    error = (errors or [writer.error])[0]
+    if error is not None:
+        if isinstance(error, WiretapException):
+            raise error
+        raise WiretapException("Unable to export %s: %s" % (clip_path, error))
+    return ExportStats(writer.written, writer.size, time.time() - start)
@@ -0,0 +1,124 @@
+# coding: utf-8
+
+import time
+import logging
+import threading
+from multiprocessing.pool import ThreadPool
+
+
+logger = logging.getLogger(__name__)
+
+
+class HostTimeout(Exception):
+    """Raised when a host does not answer in time"""
+    pass
+
+
+class HostResult(object):
+    """Outcome of an operation on one host"""
+
+    def __init__(self, hostname, value=None, error=None, elapsed=0.0):
+        """
+
+        :param hostname: Wiretap server
+        :type hostname: string
+        :param value: value returned by the operation
+        :param error: exception raised by the operation, None on success
+        :type error: Exception
+        :param elapsed: duration of the operation in seconds
+        :type elapsed: float
+        """
+        self.hostname = hostname
+        self.value = value
+        self.error = error
+        self.elapsed = elapsed
+
+    @property
+    def ok(self):
+        return self.error is None
+
+    def __repr__(self):
+        if self.ok:
+            return "HostResult(%r, %r)" % (self.hostname, self.value)
+        return "HostResult(%r, error=%r)" % (self.hostname, self.error)
+
+
+def parse_hosts(servers=None, server_file=None):
+    """
+    Build the list of hosts from --server values and a host file.
+    Values may hold several comma separated hosts, host file lines starting
+    with # are ignored. Duplicates are removed.
+
+    :param servers: hostnames
+    :type servers: list
+    :param server_file: file with one hostname per line
+    :type server_file: file
+    :return: hostnames
+    :rtype: list
+    """
+    hosts = []
+    for value in servers or []:
+        hosts.extend(value.split(','))
+    if server_file:
+        for line in server_file:
+            line = line.split('#', 1)[0]
+            hosts.extend(line.split())
+
+    unique = []
+    for host in hosts:
+        host = host.strip()
+        if host and host not in unique:
+            unique.append(host)
+    return unique
+
+
+def _run_with_timeout(operation, hostname, timeout):
+    start = time.time()
+    outcome = {}
+
+    def target():
+        try:
+            outcome['value'] = operation(hostname)
+        except Exception as e:
+            outcome['error'] = e
+
+    # run in a daemon thread so that a hung server does not hold a worker
+    thread = threading.Thread(target=target, name="wiretap-%s" % hostname)
+    thread.daemon = True
+    thread.start()
+    thread.join(timeout)
+
+    elapsed = time.time() - start
+    if thread.is_alive():
+        return HostResult(hostname, error=HostTimeout("No answer after %ss" % timeout), elapsed=elapsed)
+    return HostResult(hostname, outcome.get('value'), outcome.get('error'), elapsed)
+
+
+def fan_out(hostnames, operation, parallel=16, timeout=None):
+    """
+    Run an operation on many hosts concurrently.
+    Results are yielded as soon as each host answers, a host failing or
+    timing out does not delay the others.
+
+    :param hostnames: Wiretap servers
+    :type hostnames: list
+    :param operation: callable taking a hostname
+    :type operation: callable
+    :param parallel: maximum number of hosts queried at the same time
+    :type parallel: int
+    :param timeout: maximum duration in seconds of the operation on each host
+    :type timeout: float
+    :return: a HostResult per host, in completion order
+    :rtype: generator
+    """
+    if not hostnames:
+        return
+    pool = ThreadPool(max(1, min(parallel, len(hostnames))))
+    try:
+        for result in pool.imap_unordered(
+                lambda hostname: _run_with_timeout(operation, hostname, timeout), hostnames):
+            if not result.ok:
+                logger.debug("%s failed after %.2fs: %s", result.hostname, result.elapsed, result.error)
+            yield result
+    finally:
+        pool.close()
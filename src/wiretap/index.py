@@ -0,0 +1,171 @@
+# coding: utf-8
+
+import threading
+from collections import deque
+
+
+# Node types which can appear directly under a node of a given type.
+# Types missing from this table are never pruned during a search.
+CHILD_TYPES = {
+    'PROJECT': ('WORKSPACE', 'LIBRARY_LIST', 'LIBRARY'),
+    'WORKSPACE': ('DESKTOP', 'LIBRARY_LIST'),
+    'DESKTOP': ('REEL_GROUP', 'REEL', 'BATCH', 'CLIP'),
+    'REEL_GROUP': ('REEL',),
+    'REEL': ('CLIP',),
+    'LIBRARY_LIST': ('LIBRARY',),
+    'LIBRARY': ('FOLDER', 'REEL', 'DESKTOP', 'CLIP'),
+    'FOLDER': ('FOLDER', 'REEL', 'DESKTOP', 'CLIP'),
+    'BATCH': (),
+    'CLIP': ('HIRES', 'LOWRES', 'AUDIO', 'SLATE'),
+    'HIRES': (),
+    'LOWRES': (),
+    'AUDIO': (),
+    'SLATE': (),
+}
+
+_descendant_types = {}
+
+
+def descendant_types(node_type):
+    """
+    Return all node types which can appear below a node of the given type
+
+    :param node_type: type of the node
+    :type node_type: string
+    :return: node types, None if the node type is unknown
+    :rtype: frozenset
+    """
+    if node_type not in CHILD_TYPES:
+        return None
+    if node_type not in _descendant_types:
+        types = set()
+        stack = list(CHILD_TYPES[node_type])
+        while stack:
+            child_type = stack.pop()
+            if child_type in types:
+                continue
+            types.add(child_type)
+            if child_type not in CHILD_TYPES:
+                # unknown type below a known one, it may contain anything
+                return None
+            stack.extend(CHILD_TYPES[child_type])
+        _descendant_types[node_type] = frozenset(types)
+    return _descendant_types[node_type]
+
+
+def may_contain(node_type, target_type):
+    """
+    Check if a node of the given type can have a descendant of the target type
+
+    :param node_type: type of the node
+    :type node_type: string
+    :param target_type: type of the searched node
+    :type target_type: string
+    :rtype: bool
+    """
+    types = descendant_types(node_type)
+    return types is None or target_type in types
+
+
+class NodeIndex(object):
+    """
+    Index of a subtree keyed by (name, node type).
+
+    The subtree is expanded lazily, one listing per node, and only below nodes
+    which may contain the searched type. Once a node has been seen its lookup
+    is a dictionary access.
+    """
+
+    def __init__(self, root_path, lister):
+        """
+
+        :param root_path: path of the indexed subtree
+        :type root_path: string
+        :param lister: callable returning (name, type, path) tuples of the children of a path
+        :type lister: callable
+        """
+        self.root_path = root_path
+        self._lister = lister
+        self._nodes = dict()
+        self._expanded = set()
+        # nodes not listed yet, grouped by node type (None for the root)
+        self._pending = {None: deque([root_path])}
+        self._lock = threading.RLock()
+
+    def __len__(self):
+        return sum(len(paths) for paths in self._nodes.values())
+
+    def find(self, node_name, node_type):
+        """
+        Find a node of the subtree
+
+        :param node_name: Name of the node we search
+        :type node_name: str
+        :param node_type: Type of the node we search
+        :type node_type: str
+        :returns: the path of the searched node or None
+        :rtype: str
+        """
+        key = (node_name, node_type)
+        with self._lock:
+            while key not in self._nodes:
+                path = self._next_pending(node_type)
+                if path is None:
+                    return None
+                self._expand(path)
+            return self._nodes[key][0]
+
+    def add(self, parent_path, node_name, node_type, path):
+        """
+        Register a node created under an indexed node
+
+        :param parent_path: path of the parent node
+        :type parent_path: str
+        :param node_name: name of the created node
+        :type node_name: str
+        :param node_type: type of the created node
+        :type node_type: str
+        :param path: path of the created node
+        :type path: str
+        """
+        with self._lock:
+            if parent_path in self._expanded:
+                self._nodes.setdefault((node_name, node_type), []).append(path)
+                # a new node has no children
+                self._expanded.add(path)
+
+    def discard(self, path):
+        """
+        Forget a node and its descendants
+
+        :param path: path of the removed node
+        :type path: str
+        """
+        prefix = path.rstrip('/') + '/'
+
+        def removed(p):
+            return p == path or p.startswith(prefix)
+
+        with self._lock:
+            for key in list(self._nodes.keys()):
+                paths = [p for p in self._nodes[key] if not removed(p)]
+                if paths:
+                    self._nodes[key] = paths
+                else:
+                    del self._nodes[key]
+            self._expanded = set(p for p in self._expanded if not removed(p))
+            for node_type in self._pending.keys():
+                self._pending[node_type] = deque(
+                    p for p in self._pending[node_type] if not removed(p))
+
+    def _next_pending(self, target_type):
+        for node_type, paths in self._pending.items():
+            if paths and may_contain(node_type, target_type):
+                return paths.popleft()
+        return None
+
+    def _expand(self, path):
+        for (name, node_type, child_path) in self._lister(path):
+            self._nodes.setdefault((name, node_type), []).append(child_path)
+            self._pending.setdefault(node_type, deque()).append(child_path)
+        self._expanded.add(path)
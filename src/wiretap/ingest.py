@@ -0,0 +1,283 @@
+# coding: utf-8
+"""
+Import of frame sequences into clip nodes.
+
+Source frames are raw files holding one frame buffer each. They are memory
+mapped and handed to the Wiretap client without being copied, by a pool of
+writer threads each with its own server handle. The number of frames in
+flight is bounded, so reading sources never runs ahead of the server.
+
+Written frames are recorded in a journal, an import started again with the
+same journal only writes the frames missing from the clip.
+"""
+
+import os
+import json
+import mmap
+import time
+import logging
+import threading
+from multiprocessing.pool import ThreadPool
+
+from wiretap import WiretapException, WiretapNodeType
+from pool import ThreadServers
+from backend import wt
+
+
+logger = logging.getLogger(__name__)
+
+
+class ImportStats(object):
+    """Outcome of an import, with the duration of each frame write"""
+
+    def __init__(self, clip_path):
+        self.clip_path = clip_path
+        self.skipped = 0
+        self.size = 0
+        self.seconds = 0.0
+        # (frame index, size, write duration) of each written frame
+        self.frame_times = []
+
+    @property
+    def frames(self):
+        return len(self.frame_times)
+
+    @property
+    def fps(self):
+        return self.frames / self.seconds if self.seconds else 0.0
+
+    def percentile(self, ratio):
+        """
+        Write duration of a percentile of the frames, in seconds
+        """
+        durations = sorted(duration for (_, _, duration) in self.frame_times)
+        if not durations:
+            return 0.0
+        return durations[min(len(durations) - 1, int(ratio * len(durations)))]
+
+    def __str__(self):
+        text = "%d frames (%.1f MB) in %.1fs: %.1f fps, %.1f MB/s" % (
+            self.frames, self.size / 1048576.0, self.seconds, self.fps,
+            self.size / 1048576.0 / self.seconds if self.seconds else 0.0)
+        if self.frame_times:
+            text += ", frame write %.1f ms median, %.1f ms p95, %.1f ms max" % (
+                self.percentile(0.5) * 1000, self.percentile(0.95) * 1000, self.percentile(1) * 1000)
+        if self.skipped:
+            text += ", %d frames already written" % self.skipped
+        return text
+
+
+class ImportJournal(object):
+    """
+    Frames written to a clip, appended to a file as they complete
+    """
+
+    def __init__(self, filename):
+        """
+
+        :param filename: journal file, None to not keep one
+        :type filename: string
+        """
+        self.filename = filename
+        self.clip_path = None
+        self.done = set()
+        self._file = None
+        self._lock = threading.Lock()
+
+    def load(self, clip_name, num_frames):
+        """
+        Read the journal of a previous import of a clip, if any
+
+        :return: path of the clip node of the previous import, None if there is none
+        :rtype: string
+        """
+        if self.filename is None or not os.path.exists(self.filename):
+            return None
+        with open(self.filename) as f:
+            lines = f.read().splitlines()
+        try:
+            header = json.loads(lines[0])
+        except (IndexError, ValueError):
+            raise WiretapException("Invalid import journal %s" % self.filename)
+        if header.get('name') != clip_name or header.get('frames') != num_frames:
+            raise WiretapException(
+                "Import journal %s is for clip %s of %s frames, remove it to start over" % (
+                    self.filename, header.get('name'), header.get('frames')))
+        # the last line may have been cut by an interruption
+        self.done = set(int(line) for line in lines[1:] if line.strip().isdigit())
+        self.clip_path = header['clip']
+        return self.clip_path
+
+    def start(self, clip_path, clip_name, num_frames):
+        """
+        Open the journal for writing, creating it for a new clip
+        """
+        self.clip_path = clip_path
+        if self.filename is None:
+            return
+        if not self.done and not os.path.exists(self.filename):
+            with open(self.filename, 'w') as f:
+                f.write(json.dumps({'clip': clip_path, 'name': clip_name, 'frames': num_frames}) + "\n")
+        self._file = open(self.filename, 'a')
+
+    def add(self, frame_idx):
+        with self._lock:
+            self.done.add(frame_idx)
+            if self._file is not None:
+                self._file.write("%d\n" % frame_idx)
+                self._file.flush()
+
+    def close(self, complete=False):
+        """
+        Close the journal, removing it once all frames are written
+        """
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        if complete and self.filename is not None and os.path.exists(self.filename):
+            os.remove(self.filename)
+
+
+def make_clip_format(width, height, bits_per_pixel=24, num_channels=3, frame_rate=25.0):
+    """
+    Build the format of a clip
+
+    :rtype: WireTapClipFormat
+    """
+    return wt.WireTapClipFormat(width, height, bits_per_pixel, num_channels, frame_rate)
+
+
+def create_clip(handler, parent_path, clip_name, clip_format, num_frames):
+    """
+    Create a clip node of a given length
+
+    :param handler: handler connected to the server
+    :type handler: WiretapHandler
+    :param parent_path: path of the library or folder holding the clip
+    :type parent_path: string
+    :param clip_name: name of the clip
+    :type clip_name: string
+    :param clip_format: format of the frames
+    :type clip_format: WireTapClipFormat
+    :param num_frames: number of frames of the clip
+    :type num_frames: int
+    :return: path of the clip node
+    :rtype: string
+    :raises WiretapException: if the clip can't be created
+    """
+    parent = wt.WireTapNodeHandle(handler._server, parent_path)
+    clip = wt.WireTapNodeHandle()
+    if not parent.createClipNode(clip_name, clip_format, WiretapNodeType.Clip, clip):
+        raise WiretapException("Unable to create clip %s: %s" % (clip_name, parent.lastError()))
+    clip_path = handler._node_path(clip)
+    handler._node_created(parent_path, clip_name, WiretapNodeType.Clip, clip_path)
+    if not clip.setNumFrames(num_frames):
+        raise WiretapException("Unable to set number of frames of clip %s: %s" % (clip_name, clip.lastError()))
+    return clip_path
+
+
+def import_frames(handler, parent_path, clip_name, files, clip_format, writers=4, in_flight=None, journal=None):
+    """
+    Create a clip and write a frame sequence into it
+
+    :param handler: handler connected to the server
+    :type handler: WiretapHandler
+    :param parent_path: path of the library or folder holding the clip
+    :type parent_path: string
+    :param clip_name: name of the clip
+    :type clip_name: string
+    :param files: raw frame files, in frame order
+    :type files: list
+    :param clip_format: format of the frames
+    :type clip_format: WireTapClipFormat
+    :param writers: number of frames written at the same time
+    :type writers: int
+    :param in_flight: maximum number of frames mapped and not yet written, twice the writers by default
+    :type in_flight: int
+    :param journal: file recording the written frames, to resume an interrupted import
+    :type journal: string
+    :rtype: ImportStats
+    :raises WiretapException: if a frame can't be read or written
+    """
+    if not files:
+        raise WiretapException("No frame to import")
+    start = time.time()
+    frame_size = clip_format.frameBufferSize()
+    num_frames = len(files)
+
+    journal = ImportJournal(journal)
+    clip_path = journal.load(clip_name, num_frames)
+    if clip_path is None:
+        clip_path = create_clip(handler, parent_path, clip_name, clip_format, num_frames)
+    else:
+        logger.info("Resume import of %s, %d/%d frames already written" % (clip_path, len(journal.done), num_frames))
+    journal.start(clip_path, clip_name, num_frames)
+
+    stats = ImportStats(clip_path)
+    stats.skipped = len(journal.done)
+    servers = ThreadServers(handler)
+    local = threading.local()
+    slots = threading.BoundedSemaphore(max(writers, in_flight or 2 * writers))
+    errors = []
+    stats_lock = threading.Lock()
+
+    def write_frame(frame_idx, frame):
+        try:
+            clip = getattr(local, 'clip', None)
+            if clip is None:
+                clip = local.clip = wt.WireTapNodeHandle(servers.get(), clip_path)
+            frame_start = time.time()
+            if not clip.writeFrame(frame_idx, frame, frame_size):
+                raise WiretapException("Unable to write frame %d of %s: %s" % (frame_idx, clip_path, clip.lastError()))
+            duration = time.time() - frame_start
+            journal.add(frame_idx)
+            with stats_lock:
+                stats.frame_times.append((frame_idx, frame_size, duration))
+                stats.size += frame_size
+        except Exception as e:
+            errors.append(e)
+        finally:
+            frame.close()
+            slots.release()
+
+    pool = ThreadPool(max(1, writers))
+    try:
+        for (frame_idx, filename) in enumerate(files):
+            if frame_idx in journal.done:
+                continue
+            # wait for a write to complete before mapping more frames
+            slots.acquire()
+            if errors:
+                slots.release()
+                break
+            try:
+                frame = _map_frame(filename, frame_size)
+            except Exception:
+                slots.release()
+                raise
+            pool.apply_async(write_frame, (frame_idx, frame))
+    finally:
+        pool.close()
+        pool.join()
+        servers.release()
+        journal.close(complete=not errors and len(journal.done) == num_frames)
+
+    if errors:
+        raise errors[0] if isinstance(errors[0], WiretapException) else WiretapException(
+            "Unable to import frames into %s: %s" % (clip_path, errors[0]))
+    stats.seconds = time.time() - start
+    return stats
+
+
+def _map_frame(filename, frame_size):
+    """
+    Map a raw frame file in memory
+
+    :rtype: mmap.mmap
+    :raises WiretapException: if the file is smaller than a frame
+    """
+    with open(filename, 'rb') as f:
+        size = os.fstat(f.fileno()).st_size
+        if size < frame_size:
+            raise WiretapException("Frame file %s is too small: %d < %d bytes" % (filename, size, frame_size))
+        return mmap.mmap(f.fileno(), frame_size, access=mmap.ACCESS_READ)
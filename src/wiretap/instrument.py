@@ -0,0 +1,230 @@
+# coding: utf-8
+"""
+Instrumentation of the Wiretap client API.
+
+When enabled with backend.instrument(), every call made through the client
+API is timed and counted per method. Nothing is wrapped while it is
+disabled, so it costs nothing then.
+"""
+
+import os
+import json
+import time
+import bisect
+import tempfile
+import threading
+
+
+# Upper bounds in seconds of the latency histogram buckets
+BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Maximum number of calls kept for the trace
+MAX_TRACE_EVENTS = 1000000
+
+
+class MethodStats(object):
+    """Call count and latency histogram of a method"""
+
+    __slots__ = ('count', 'total', 'maximum', 'buckets')
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.maximum = 0.0
+        # the last bucket counts calls slower than all bounds
+        self.buckets = [0] * (len(BUCKETS) + 1)
+
+    def observe(self, duration):
+        self.count += 1
+        self.total += duration
+        self.maximum = max(self.maximum, duration)
+        self.buckets[bisect.bisect_left(BUCKETS, duration)] += 1
+
+    def percentile(self, ratio):
+        """
+        Upper bound of the bucket holding the given percentile, None if above all bounds
+        """
+        rank = ratio * self.count
+        seen = 0
+        for (idx, count) in enumerate(self.buckets):
+            seen += count
+            if seen >= rank and count:
+                return BUCKETS[idx] if idx < len(BUCKETS) else None
+        return None
+
+
+class Stats(object):
+    """Statistics of the Wiretap API calls of a run"""
+
+    def __init__(self, trace=False):
+        """
+
+        :param trace: keep every call to write a Chrome trace
+        :type trace: bool
+        """
+        self.trace = trace
+        self.methods = dict()
+        self.events = []
+        self.start = time.time()
+        self._lock = threading.Lock()
+
+    def record(self, method, start, duration):
+        """
+        Record a call
+
+        :param method: name of the called method
+        :type method: string
+        :param start: time the call started at
+        :type start: float
+        :param duration: duration of the call in seconds
+        :type duration: float
+        """
+        with self._lock:
+            stats = self.methods.get(method)
+            if stats is None:
+                stats = self.methods[method] = MethodStats()
+            stats.observe(duration)
+            if self.trace and len(self.events) < MAX_TRACE_EVENTS:
+                self.events.append((method, start, duration, threading.current_thread().ident))
+
+    def report(self):
+        """
+        Table of call counts and latencies per method
+
+        :rtype: string
+        """
+        lines = ["%-24s %8s %10s %10s %10s %10s" % ('method', 'calls', 'total (s)', 'mean (ms)', 'p95 (ms)', 'max (ms)')]
+        with self._lock:
+            methods = sorted(self.methods.items(), key=lambda item: -item[1].total)
+            for (method, stats) in methods:
+                p95 = stats.percentile(0.95)
+                lines.append("%-24s %8d %10.3f %10.3f %10s %10.3f" % (
+                    method, stats.count, stats.total, stats.total * 1000 / stats.count,
+                    '%.3f' % (p95 * 1000) if p95 is not None else '>%d' % (BUCKETS[-1] * 1000),
+                    stats.maximum * 1000))
+            lines.append("%-24s %8d %10.3f" % (
+                'total', sum(s.count for s in self.methods.values()),
+                sum(s.total for s in self.methods.values())))
+        return "\n".join(lines)
+
+    def prometheus(self, labels=None):
+        """
+        Statistics in the Prometheus text exposition format
+
+        :param labels: labels added to every sample, ex: {'command': 'list-project'}
+        :type labels: dict
+        :rtype: string
+        """
+        def format_labels(extra):
+            items = sorted((labels or {}).items()) + extra
+            return '{%s}' % ','.join('%s="%s"' % (k, str(v).replace('\\', '\\\\').replace('"', '\\"')) for (k, v) in items)
+
+        lines = [
+            "# HELP wiretap_calls_total Number of Wiretap API calls.",
+            "# TYPE wiretap_calls_total counter"]
+        with self._lock:
+            methods = sorted(self.methods.items())
+            for (method, stats) in methods:
+                lines.append("wiretap_calls_total%s %d" % (format_labels([('method', method)]), stats.count))
+
+            lines.extend([
+                "# HELP wiretap_call_duration_seconds Duration of Wiretap API calls.",
+                "# TYPE wiretap_call_duration_seconds histogram"])
+            for (method, stats) in methods:
+                cumulated = 0
+                for (bound, count) in zip(BUCKETS + ('+Inf',), stats.buckets):
+                    cumulated += count
+                    lines.append("wiretap_call_duration_seconds_bucket%s %d" % (
+                        format_labels([('method', method), ('le', bound)]), cumulated))
+                lines.append("wiretap_call_duration_seconds_sum%s %.6f" % (
+                    format_labels([('method', method)]), stats.total))
+                lines.append("wiretap_call_duration_seconds_count%s %d" % (
+                    format_labels([('method', method)]), stats.count))
+        return "\n".join(lines) + "\n"
+
+    def write_prometheus(self, filename, labels=None):
+        """
+        Write statistics to a Prometheus node exporter text file.
+        The file is replaced atomically so that it is never read half written.
+        """
+        directory = os.path.dirname(os.path.abspath(filename))
+        fd, tmp_name = tempfile.mkstemp(dir=directory, suffix='.tmp')
+        with os.fdopen(fd, 'w') as f:
+            f.write(self.prometheus(labels))
+        os.chmod(tmp_name, 0o644)
+        os.rename(tmp_name, filename)
+
+    def chrome_trace(self):
+        """
+        Calls in the Chrome trace event format, to load in chrome://tracing or Perfetto
+
+        :rtype: dict
+        """
+        pid = os.getpid()
+        with self._lock:
+            events = [{
+                'name': method, 'cat': 'wiretap', 'ph': 'X', 'pid': pid, 'tid': tid,
+                'ts': int((start - self.start) * 1000000), 'dur': int(duration * 1000000)}
+                for (method, start, duration, tid) in self.events]
+        return {'traceEvents': events, 'displayTimeUnit': 'ms'}
+
+    def write_chrome_trace(self, filename):
+        with open(filename, 'w') as f:
+            json.dump(self.chrome_trace(), f)
+
+
+def _unwrap(value):
+    return getattr(value, '_wrapped', value)
+
+
+def _timed(stats, name, function):
+    def call(*args):
+        start = time.time()
+        try:
+            return function(*[_unwrap(arg) for arg in args])
+        finally:
+            stats.record(name, start, time.time() - start)
+    return call
+
+
+class InstrumentedBackend(object):
+    """
+    Backend recording the calls made to another one.
+
+    Functions and node handle methods are timed. Node handles are wrapped so
+    that handles passed as arguments (ex: getChild, createNode) are given
+    unwrapped to the real backend.
+    """
+
+    def __init__(self, backend, stats):
+        """
+
+        :param backend: the instrumented backend
+        :param stats: where calls are recorded
+        :type stats: Stats
+        """
+        self._backend = backend
+        self._stats = stats
+
+        class WireTapNodeHandle(object):
+            __slots__ = ('_wrapped',)
+
+            def __init__(self, *args):
+                self._wrapped = backend.WireTapNodeHandle(*[_unwrap(arg) for arg in args])
+
+            def __getattr__(self, name):
+                attr = getattr(self._wrapped, name)
+                if not callable(attr):
+                    return attr
+                return _timed(stats, name, attr)
+
+        self.WireTapNodeHandle = WireTapNodeHandle
+
+    def __getattr__(self, name):
+        attr = getattr(self._backend, name)
+        if callable(attr) and not isinstance(attr, type):
+            attr = _timed(self._stats, name, attr)
+        elif name == 'WireTapServerHandle':
+            attr = _timed(self._stats, name, attr)
+        setattr(self, name, attr)
+        return attr
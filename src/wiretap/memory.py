@@ -0,0 +1,566 @@
+# coding: utf-8
+"""
+In-memory implementation of the Wiretap python client API.
+
+Each hostname gets its own database, created on first connection with the
+/projects, /users and /volumes nodes and one volume. Node ids are the node
+paths. Creating a node under a volume creates a project, like a Flame
+server does.
+
+Every call which would reach the server on a real client is counted, and
+can be slowed down with an artificial latency to mimic the network.
+"""
+
+import time
+import threading
+from collections import defaultdict
+
+
+DEFAULT_VOLUME = 'stonefs'
+# width, height, bits per pixel, channels, frame rate of generated clips
+DEFAULT_CLIP_FORMAT = (320, 180, 24, 3, 25.0)
+
+_databases = dict()
+_lock = threading.RLock()
+
+_latency = {'default': 0.0}
+_calls = defaultdict(int)
+_calls_lock = threading.Lock()
+
+
+def set_latency(latency=0.0, **per_method):
+    """
+    Set the artificial latency of server calls
+
+    :param latency: delay in seconds added to every server call
+    :type latency: float
+    :param per_method: delay of specific methods, ex: createNode=0.01
+    """
+    _latency.clear()
+    _latency['default'] = latency
+    _latency.update(per_method)
+
+
+def call_counts():
+    """
+    Number of server calls per method since the last reset
+
+    :rtype: dict
+    """
+    with _calls_lock:
+        return dict(_calls)
+
+
+def round_trips():
+    """
+    Total number of server calls since the last reset
+
+    :rtype: int
+    """
+    with _calls_lock:
+        return sum(_calls.values())
+
+
+def reset_counts():
+    """
+    Reset server call counters
+    """
+    with _calls_lock:
+        _calls.clear()
+
+
+def _server_call(method):
+    name = method.__name__
+
+    def wrapper(*args, **kwargs):
+        with _calls_lock:
+            _calls[name] += 1
+        delay = _latency.get(name, _latency['default'])
+        if delay:
+            time.sleep(delay)
+        return method(*args, **kwargs)
+
+    wrapper.__name__ = name
+    wrapper.__doc__ = method.__doc__
+    return wrapper
+
+
+class MemoryNode(object):
+    """A node of an in-memory database"""
+
+    __slots__ = ('name', 'node_type', 'path', 'parent', 'children', 'metadata', 'clip_format', 'num_frames', 'frames')
+
+    def __init__(self, name, node_type, path, parent=None):
+        self.name = name
+        self.node_type = node_type
+        self.path = path
+        self.parent = parent
+        self.children = []
+        self.metadata = dict()
+        # WireTapClipFormat arguments of clip nodes
+        self.clip_format = None
+        self.num_frames = 0
+        # written frames by index, the others are generated
+        self.frames = None
+
+
+class MemoryDatabase(object):
+    """Node tree of an in-memory server"""
+
+    def __init__(self, hostname):
+        self.hostname = hostname
+        self.nodes = dict()
+        self.root = self._add(None, '', 'NODE', '/')
+        for name in ('projects', 'users', 'volumes'):
+            self.add_node('/', name, 'NODE')
+        self.add_node('/volumes', DEFAULT_VOLUME, 'VOLUME')
+
+    def _add(self, parent, name, node_type, path):
+        node = MemoryNode(name, node_type, path, parent)
+        self.nodes[path] = node
+        if parent is not None:
+            parent.children.append(node)
+        return node
+
+    def add_node(self, parent_path, name, node_type):
+        """
+        Add a node to the database
+
+        :param parent_path: path of the parent node
+        :type parent_path: string
+        :param name: name of the node
+        :type name: string
+        :param node_type: type of the node
+        :type node_type: string
+        :return: the created node, None if the parent does not exist or
+            already has a child with that name
+        :rtype: MemoryNode
+        """
+        with _lock:
+            parent = self.nodes.get(parent_path)
+            if parent is None:
+                return None
+            path = parent.path.rstrip('/') + '/' + name
+            if path in self.nodes:
+                return None
+
+            if parent.node_type == 'VOLUME':
+                # projects are created on a volume and listed under /projects
+                path = '/projects/%s' % name
+                if path in self.nodes:
+                    return None
+                node = self._add(self.nodes['/projects'], name, 'PROJECT', path)
+                parent.children.append(node)
+                return node
+
+            return self._add(parent, name, node_type, path)
+
+    def remove_node(self, path):
+        """
+        Remove a node and its descendants from the database
+
+        :param path: path of the node
+        :type path: string
+        :return: False if the node does not exist
+        :rtype: bool
+        """
+        with _lock:
+            node = self.nodes.get(path)
+            if node is None or node is self.root:
+                return False
+            holders = [node.parent]
+            if node.node_type == 'PROJECT':
+                holders.extend(self.nodes['/volumes'].children)
+            for holder in holders:
+                if node in holder.children:
+                    holder.children.remove(node)
+            stack = [node]
+            while stack:
+                current = stack.pop()
+                self.nodes.pop(current.path, None)
+                stack.extend(current.children)
+            return True
+
+
+def get_database(hostname):
+    """
+    Return the database of a server, creating it if needed
+
+    :param hostname: server name
+    :type hostname: string
+    :rtype: MemoryDatabase
+    """
+    with _lock:
+        if hostname not in _databases:
+            _databases[hostname] = MemoryDatabase(hostname)
+        return _databases[hostname]
+
+
+def add_volume(hostname, volume_name, total=None, free=None):
+    """
+    Add a volume to a database, with its capacity in the volume metadata.
+
+    :param hostname: server name
+    :type hostname: string
+    :param volume_name: name of the volume
+    :type volume_name: string
+    :param total: total space, not reported if None
+    :type total: int
+    :param free: free space, not reported if None
+    :type free: int
+    :return: the volume node, None if it already exists
+    :rtype: MemoryNode
+    """
+    database = get_database(hostname)
+    with _lock:
+        volume = database.add_node('/volumes', volume_name, 'VOLUME')
+        if volume is not None:
+            xml = '<Volume>'
+            if total is not None:
+                xml += '<TotalSize>%d</TotalSize>' % total
+            if free is not None:
+                xml += '<FreeSize>%d</FreeSize>' % free
+            volume.metadata['XML'] = xml + '</Volume>'
+        return volume
+
+
+def add_project(hostname, project_name, libraries=1, clips=0, frames=0):
+    """
+    Add a generated project to a database, without latency nor call counting.
+
+    The project gets a workspace with a desktop and a library list holding
+    the given number of libraries, clips being spread over the libraries.
+    Clips have the DEFAULT_CLIP_FORMAT and frames filled with a generated
+    pattern.
+
+    :param hostname: server name
+    :type hostname: string
+    :param project_name: name of the project
+    :type project_name: string
+    :param libraries: number of libraries
+    :type libraries: int
+    :param clips: number of clips
+    :type clips: int
+    :param frames: number of frames of each clip
+    :type frames: int
+    :return: the project node, None if it already exists
+    :rtype: MemoryNode
+    """
+    database = get_database(hostname)
+    with _lock:
+        project = database.add_node('/volumes/%s' % DEFAULT_VOLUME, project_name, 'NODE')
+        if project is None:
+            return None
+        workspace = database.add_node(project.path, 'Workspace', 'WORKSPACE')
+        database.add_node(workspace.path, 'Desktop', 'DESKTOP')
+        library_list = database.add_node(workspace.path, 'Libraries', 'LIBRARY_LIST')
+        library_paths = [
+            database.add_node(library_list.path, 'library_%03d' % library_idx, 'LIBRARY').path
+            for library_idx in range(max(1, libraries))]
+        for clip_idx in range(clips):
+            library_path = library_paths[clip_idx % len(library_paths)]
+            clip = database.add_node(library_path, 'clip_%06d' % clip_idx, 'CLIP')
+            clip.clip_format = DEFAULT_CLIP_FORMAT
+            clip.num_frames = frames
+        return project
+
+
+def populate(hostname='localhost', projects=0, users=0, libraries=1, clips=0):
+    """
+    Fill a database with generated projects and users, without latency nor
+    call counting.
+
+    :param hostname: server name
+    :type hostname: string
+    :param projects: number of projects to create
+    :type projects: int
+    :param users: number of users to create
+    :type users: int
+    :param libraries: number of libraries per project
+    :type libraries: int
+    :param clips: number of clips per project
+    :type clips: int
+    :rtype: MemoryDatabase
+    """
+    database = get_database(hostname)
+    with _lock:
+        for user_idx in range(users):
+            database.add_node('/users', 'user_%05d' % user_idx, 'USER')
+        for project_idx in range(projects):
+            add_project(hostname, 'project_%05d' % project_idx, libraries=libraries, clips=clips)
+    return database
+
+
+def reset(hostname=None):
+    """
+    Drop the database of a server, or of all servers
+    """
+    with _lock:
+        if hostname is None:
+            _databases.clear()
+        else:
+            _databases.pop(hostname, None)
+
+
+def WireTapClientInit():
+    return True
+
+
+def WireTapClientUninit():
+    return True
+
+
+class WireTapServerHandle(object):
+
+    def __init__(self, hostname='localhost'):
+        self.hostname = hostname
+
+    @property
+    def database(self):
+        # looked up on each call, so that a reset database is seen by open handles
+        return get_database(self.hostname)
+
+
+class WireTapStr(object):
+
+    def __init__(self, value=''):
+        self.value = value
+
+    def c_str(self):
+        return self.value
+
+    def __str__(self):
+        return self.value
+
+
+class WireTapInt(object):
+
+    def __init__(self, value=0):
+        self.value = value
+
+    def __int__(self):
+        return self.value
+
+    __index__ = __int__
+
+
+class WireTapClipFormat(object):
+
+    def __init__(self, width=0, height=0, bitsPerPixel=0, numChannels=0, frameRate=0.0):
+        self._set(width, height, bitsPerPixel, numChannels, frameRate)
+
+    def _set(self, width, height, bits_per_pixel, num_channels, frame_rate):
+        self._format = (width, height, bits_per_pixel, num_channels, frame_rate)
+
+    def width(self):
+        return self._format[0]
+
+    def height(self):
+        return self._format[1]
+
+    def bitsPerPixel(self):
+        return self._format[2]
+
+    def numChannels(self):
+        return self._format[3]
+
+    def frameRate(self):
+        return self._format[4]
+
+    def frameBufferSize(self):
+        return self.width() * self.height() * self.bitsPerPixel() // 8
+
+    def _args(self):
+        return self._format
+
+
+def _frame_pattern(node, frame_idx, size):
+    """
+    Content of a generated frame: a line of bytes depending on the clip and
+    the frame, repeated
+    """
+    line = bytearray((hash(node.path) + frame_idx + i) % 256 for i in range(256))
+    return (bytes(line) * (size // 256 + 1))[:size]
+
+
+class WireTapNodeId(object):
+
+    def __init__(self, node_id=''):
+        self._id = node_id
+
+    def id(self):
+        return self._id
+
+
+class WireTapNodeHandle(object):
+
+    def __init__(self, server=None, node_id=None):
+        self._server = server
+        self._node_id = node_id
+        self._error = ''
+
+    def _node(self):
+        node = None
+        if self._server is not None:
+            node = self._server.database.nodes.get(self._node_id)
+        if node is None:
+            self._error = "Node not found: %s" % self._node_id
+        return node
+
+    def _set(self, server, node_id):
+        self._server = server
+        self._node_id = node_id
+
+    def lastError(self):
+        return self._error
+
+    def getNodeId(self):
+        return WireTapNodeId(self._node_id or '')
+
+    @_server_call
+    def getDisplayName(self, name):
+        node = self._node()
+        if node is None:
+            return False
+        name.value = node.name
+        return True
+
+    @_server_call
+    def getNodeTypeStr(self, node_type):
+        node = self._node()
+        if node is None:
+            return False
+        node_type.value = node.node_type
+        return True
+
+    @_server_call
+    def getNumChildren(self, num_children):
+        node = self._node()
+        if node is None:
+            return False
+        num_children.value = len(node.children)
+        return True
+
+    @_server_call
+    def getChild(self, child_idx, child):
+        node = self._node()
+        if node is None:
+            return False
+        try:
+            child._set(self._server, node.children[int(child_idx)].path)
+        except IndexError:
+            self._error = "Child index out of range: %s" % child_idx
+            return False
+        return True
+
+    @_server_call
+    def createNode(self, node_name, node_type, child):
+        node = self._node()
+        if node is None:
+            return False
+        created = self._server.database.add_node(node.path, node_name, node_type)
+        if created is None:
+            self._error = "Node already exists: %s" % node_name
+            return False
+        child._set(self._server, created.path)
+        return True
+
+    @_server_call
+    def destroyNode(self):
+        if self._node() is None:
+            return False
+        return self._server.database.remove_node(self._node_id)
+
+    @_server_call
+    def getMetaData(self, stream_name, filter_string, depth, metadata):
+        node = self._node()
+        if node is None:
+            return False
+        metadata.value = node.metadata.get(stream_name, '')
+        return True
+
+    @_server_call
+    def setMetaData(self, stream_name, metadata):
+        node = self._node()
+        if node is None:
+            return False
+        node.metadata[stream_name] = str(metadata)
+        return True
+
+    def _clip(self):
+        node = self._node()
+        if node is not None and node.clip_format is None:
+            self._error = "Not a clip node: %s" % self._node_id
+            return None
+        return node
+
+    @_server_call
+    def getClipFormat(self, clip_format):
+        node = self._clip()
+        if node is None:
+            return False
+        clip_format._set(*node.clip_format)
+        return True
+
+    @_server_call
+    def getNumFrames(self, num_frames):
+        node = self._clip()
+        if node is None:
+            return False
+        num_frames.value = node.num_frames
+        return True
+
+    @_server_call
+    def readFrame(self, frame_idx, frame_buffer, buffer_size):
+        node = self._clip()
+        if node is None:
+            return False
+        frame_size = WireTapClipFormat(*node.clip_format).frameBufferSize()
+        if not 0 <= frame_idx < node.num_frames:
+            self._error = "Frame index out of range: %s" % frame_idx
+            return False
+        if buffer_size < frame_size or len(frame_buffer) < frame_size:
+            self._error = "Frame buffer too small: %d < %d" % (buffer_size, frame_size)
+            return False
+        frame = (node.frames or {}).get(frame_idx)
+        frame_buffer[:frame_size] = frame if frame is not None else _frame_pattern(node, frame_idx, frame_size)
+        return True
+
+    @_server_call
+    def createClipNode(self, node_name, clip_format, node_type, child):
+        node = self._node()
+        if node is None:
+            return False
+        created = self._server.database.add_node(node.path, node_name, node_type)
+        if created is None:
+            self._error = "Node already exists: %s" % node_name
+            return False
+        created.clip_format = clip_format._args()
+        created.frames = dict()
+        child._set(self._server, created.path)
+        return True
+
+    @_server_call
+    def setNumFrames(self, num_frames):
+        node = self._clip()
+        if node is None:
+            return False
+        node.num_frames = int(num_frames)
+        return True
+
+    @_server_call
+    def writeFrame(self, frame_idx, frame_buffer, buffer_size):
+        node = self._clip()
+        if node is None:
+            return False
+        frame_size = WireTapClipFormat(*node.clip_format).frameBufferSize()
+        if not 0 <= frame_idx < node.num_frames:
+            self._error = "Frame index out of range: %s" % frame_idx
+            return False
+        if buffer_size < frame_size or len(frame_buffer) < frame_size:
+            self._error = "Frame buffer too small: %d < %d" % (buffer_size, frame_size)
+            return False
+        if node.frames is None:
+            node.frames = dict()
+        node.frames[frame_idx] = bytes(frame_buffer[:frame_size])
+        return True
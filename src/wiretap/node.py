@@ -0,0 +1,198 @@
+# coding: utf-8
+"""
+Compact description of Wiretap nodes.
+
+A Node only keeps its path, name and type. The native handle is opened on
+first use, and the children are kept as parallel tuples of names, types and
+paths, Node objects being created only for the children actually visited.
+Nodes compare and hash on their server and path, so that they can be kept
+in sets and used as dictionary keys.
+"""
+
+from wiretap import WiretapException
+from backend import wt
+
+
+def _read_str(handle, method):
+    value = wt.WireTapStr()
+    if not getattr(handle, method)(value):
+        raise WiretapException("Unable to read %s of node: %s" % (method, handle.lastError()))
+    return value.c_str()
+
+
+class Node(object):
+    """A node of a Wiretap server"""
+
+    __slots__ = (
+        'path', '_handler', '_name', '_type', '_handle',
+        '_child_names', '_child_types', '_child_paths', '_child_nodes')
+
+    def __init__(self, handler, path, name=None, node_type=None):
+        """
+
+        :param handler: handler connected to the server of the node
+        :type handler: WiretapHandler
+        :param path: path (node id) of the node
+        :type path: string
+        :param name: display name, read from the server when first needed if None
+        :type name: string
+        :param node_type: node type, read from the server when first needed if None
+        :type node_type: string
+        """
+        self.path = path
+        self._handler = handler
+        self._name = name
+        self._type = intern(node_type) if node_type is not None else None
+        self._handle = None
+        self._child_names = None
+        self._child_types = None
+        self._child_paths = None
+        self._child_nodes = None
+
+    @property
+    def handle(self):
+        """
+        Native handle of the node, opened on first use
+
+        :rtype: WireTapNodeHandle
+        """
+        if self._handle is None:
+            self._handle = wt.WireTapNodeHandle(self._handler._server, self.path)
+        return self._handle
+
+    @property
+    def name(self):
+        if self._name is None:
+            self._name = _read_str(self.handle, 'getDisplayName')
+        return self._name
+
+    @property
+    def node_type(self):
+        if self._type is None:
+            self._type = intern(_read_str(self.handle, 'getNodeTypeStr'))
+        return self._type
+
+    def _set_children(self, names, types, paths, nodes=None):
+        self._child_names = tuple(names)
+        self._child_types = tuple(intern(t) for t in types)
+        self._child_paths = tuple(paths)
+        self._child_nodes = list(nodes) if nodes is not None else [None] * len(self._child_paths)
+
+    def _load_children(self):
+        if self._child_paths is None:
+            children = self._handler._list_children(self.path)
+            self._set_children(
+                [name for (name, _, _) in children],
+                [node_type for (_, node_type, _) in children],
+                [path for (_, _, path) in children])
+
+    def _child(self, idx):
+        node = self._child_nodes[idx]
+        if node is None:
+            node = self._child_nodes[idx] = Node(
+                self._handler, self._child_paths[idx], self._child_names[idx], self._child_types[idx])
+        return node
+
+    @property
+    def children(self):
+        """
+        Children of the node, listed on first access
+
+        :rtype: list
+        """
+        self._load_children()
+        return [self._child(idx) for idx in range(len(self._child_paths))]
+
+    @property
+    def child_names(self):
+        self._load_children()
+        return self._child_names
+
+    def child(self, name, node_type=None):
+        """
+        Find a child by name, and type if given
+
+        :return: the child, None if not found
+        :rtype: Node
+        """
+        self._load_children()
+        for (idx, child_name) in enumerate(self._child_names):
+            if child_name == name and (node_type is None or self._child_types[idx] == node_type):
+                return self._child(idx)
+        return None
+
+    def refresh(self):
+        """
+        Forget the children, they are listed again on next access
+        """
+        self._handler.invalidate(self.path)
+        self._child_names = self._child_types = self._child_paths = self._child_nodes = None
+
+    def __len__(self):
+        self._load_children()
+        return len(self._child_paths)
+
+    def __iter__(self):
+        return iter(self.children)
+
+    def _key(self):
+        return (self._handler.hostname, self.path)
+
+    def __eq__(self, other):
+        if not isinstance(other, Node):
+            return NotImplemented
+        return self.path == other.path and self._handler.hostname == other._handler.hostname
+
+    def __ne__(self, other):
+        result = self.__eq__(other)
+        return result if result is NotImplemented else not result
+
+    def __lt__(self, other):
+        if not isinstance(other, Node):
+            return NotImplemented
+        return self._key() < other._key()
+
+    def __hash__(self):
+        return hash(self.path)
+
+    def __repr__(self):
+        return "Node(%r, %r, %r)" % (self.path, self._name, self._type)
+
+
+def build_tree(handler, path='/', max_depth=None):
+    """
+    Read a whole subtree into Node objects, listing each node once
+
+    :param handler: handler connected to the server
+    :type handler: WiretapHandler
+    :param path: path of the top node
+    :type path: string
+    :param max_depth: how deep to read, None for no limit
+    :type max_depth: int
+    :return: the top node, with the children of every node above max_depth loaded
+    :rtype: Node
+    """
+    root = Node(handler, path)
+    # nodes from the top one to the current one, with their children read so far
+    stack = [(root, [], [], [], [])]
+
+    def close():
+        depth = len(stack) - 1
+        node, names, types, paths, nodes = stack.pop()
+        # children of the deepest nodes were not read
+        if max_depth is None or depth < max_depth:
+            node._set_children(names, types, paths, nodes)
+
+    for (child_path, name, node_type, depth) in handler.walk(path, max_depth=max_depth, with_depth=True):
+        while len(stack) > depth:
+            close()
+        node = Node(handler, child_path, name, node_type)
+        _, names, types, paths, nodes = stack[-1]
+        names.append(name)
+        types.append(node_type)
+        paths.append(child_path)
+        nodes.append(node)
+        stack.append((node, [], [], [], []))
+    while stack:
+        close()
+    return root
@@ -0,0 +1,116 @@
+# coding: utf-8
+"""
+Operations of the command line tool, run by name with JSON parameters.
+
+They are run either in the command line process or by the daemon on its
+behalf, so parameters and results only hold JSON types.
+"""
+
+import logging
+
+from wiretap import WiretapException
+
+
+logger = logging.getLogger(__name__)
+
+
+def list_projects(handler, params):
+    return handler.get_projects()
+
+
+def list_users(handler, params):
+    return handler.get_users()
+
+
+def project_info(handler, params):
+    """
+    Settings of projects, all of them if no names are given
+
+    :return: [project name, settings or None] pairs, in the order of the projects
+    :rtype: list
+    """
+    names = params.get('names') or handler.get_projects()
+    settings = handler.get_projects_settings(names, workers=params.get('workers', 8))
+    return [[name, settings.get(name)] for name in names]
+
+
+def create_project(handler, params):
+    """
+    Create a project if it does not exist, then its missing libraries and folders
+
+    :return: whether the project was created and the number of library nodes created
+    :rtype: dict
+    """
+    name = params['name']
+    project = handler.create_project(
+        name, params.get('settings') or {}, volume=params.get('volume'),
+        placement=params.get('placement') or 'first')
+    created = project is not None
+    if not created:
+        logger.info("Project '%s' already exists." % name)
+        project = handler.get_project(name)
+
+    nodes = 0
+    for (library_name, layout) in (params.get('libraries') or {}).items():
+        plan = handler._create_project_librairies(project, library_name, layout, workers=params.get('workers', 8))
+        logger.info("%d node(s) created in %s." % (len(plan), library_name))
+        nodes += len(plan)
+    return {'created': created, 'nodes': nodes}
+
+
+def update_projects(handler, params):
+    """
+    Change settings of the projects matching a pattern
+
+    :return: name, changed settings and error of each matching project, sorted by name
+    :rtype: list
+    """
+    results = handler.update_projects(
+        params['pattern'], params.get('settings') or {}, regex=params.get('regex', False),
+        ignore_case=params.get('ignore_case', False), workers=params.get('workers', 8),
+        dry_run=params.get('dry_run', False))
+    return sorted(
+        ({'name': result.name, 'changes': result.changes,
+          'error': str(result.error) if result.error is not None else None} for result in results),
+        key=lambda result: result['name'])
+
+
+def create_users(handler, params):
+    names = params.get('names') or [params['name']]
+    nodes = handler.create_users(names, workers=params.get('workers', 8))
+    return [handler._node_path(node) for node in nodes]
+
+
+def delete_user(handler, params):
+    handler.delete_user(params['name'])
+
+
+OPERATIONS = {
+    'list-project': list_projects,
+    'list-user': list_users,
+    'project-info': project_info,
+    'create-project': create_project,
+    'update-projects': update_projects,
+    'create-user': create_users,
+    'delete-user': delete_user,
+}
+
+
+def run(handler, operation, params=None):
+    """
+    Run an operation
+
+    :param handler: handler connected to the server
+    :type handler: WiretapHandler
+    :param operation: name of the operation, ex: 'list-project'
+    :type operation: string
+    :param params: parameters of the operation
+    :type params: dict
+    :return: result of the operation
+    :raises WiretapException: if the operation is unknown or fails
+    """
+    try:
+        function = OPERATIONS[operation]
+    except KeyError:
+        raise WiretapException("Unknown operation %s" % operation)
+    return function(handler, params or {})
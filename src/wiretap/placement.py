@@ -0,0 +1,249 @@
+# coding: utf-8
+"""
+Choice of the volume (framestore) holding a new project.
+
+A placement policy picks one volume among those of a server. Volume usage,
+the capacity reported in the volume metadata and the number of projects
+stored on it, is only read when a policy asks for it, and kept by the
+handler for a few seconds (volume_info_ttl) so that projects created in a row
+don't read it again each time.
+
+Policies are callables taking the hostname, the VolumeInfo of each volume and
+a dry_run flag, and returning one of them. A policy keeping some state must
+leave it unchanged on dry runs. Other policies can be added with
+register_policy().
+
+The round-robin position of each server is only kept by the process, unless
+a persistent store such as a DiskCache is given to use_counters(), as the
+command line does, so that projects created by separate invocations still go
+to each volume in turn.
+"""
+
+import logging
+import threading
+from collections import defaultdict
+
+from wiretap import WiretapException, parse_project_xml
+
+
+logger = logging.getLogger(__name__)
+
+# metadata elements holding the capacity of a volume, as reported by the server
+FREE_SPACE_KEYS = ('FreeSpace', 'FreeSize', 'Free', 'AvailableSpace')
+TOTAL_SPACE_KEYS = ('TotalSpace', 'TotalSize', 'Total', 'Capacity', 'Size')
+
+
+def _size(metadata, keys):
+    lowered = dict((key.lower(), value) for (key, value) in metadata.items() if not isinstance(value, dict))
+    for key in keys:
+        value = lowered.get(key.lower())
+        if value:
+            try:
+                return float(value.split()[0])
+            except ValueError:
+                logger.debug("Invalid volume size %s: %s", key, value)
+    return None
+
+
+class VolumeInfo(object):
+    """
+    Usage of a volume, read from the server on first access
+    """
+
+    def __init__(self, handler, name):
+        """
+
+        :param handler: handler connected to the server of the volume
+        :type handler: WiretapHandler
+        :param name: name of the volume
+        :type name: string
+        """
+        self.name = name
+        self.path = "/volumes/%s" % name
+        self._handler = handler
+        self._capacity = None
+        self._projects = None
+
+    def _read_capacity(self):
+        if self._capacity is None:
+            try:
+                metadata = parse_project_xml(self._handler._read_metadata(self.path))
+            except WiretapException as e:
+                logger.debug("Unable to read capacity of volume %s: %s", self.name, e)
+                metadata = dict()
+            self._capacity = (_size(metadata, FREE_SPACE_KEYS), _size(metadata, TOTAL_SPACE_KEYS))
+        return self._capacity
+
+    @property
+    def free(self):
+        """
+        Free space, None if the server does not report it
+        """
+        return self._read_capacity()[0]
+
+    @property
+    def total(self):
+        """
+        Total space, None if the server does not report it
+        """
+        return self._read_capacity()[1]
+
+    @property
+    def projects(self):
+        """
+        Number of projects stored on the volume
+        """
+        if self._projects is None:
+            self._projects = len(self._handler._read_children(self.path, with_types=False))
+        return self._projects
+
+    def __str__(self):
+        details = []
+        if self._capacity is not None:
+            free, total = self._capacity
+            details.append("free: %s" % ('unknown' if free is None else '%g' % free))
+            if total is not None:
+                details.append("total: %g" % total)
+        if self._projects is not None:
+            details.append("projects: %d" % self._projects)
+        return "%s (%s)" % (self.name, ", ".join(details)) if details else self.name
+
+    def __repr__(self):
+        return "VolumeInfo(%r)" % self.name
+
+
+def first_volume(hostname, volumes, dry_run=False):
+    return volumes[0]
+
+
+def most_free_space(hostname, volumes, dry_run=False):
+    known = [volume for volume in volumes if volume.free is not None]
+    if not known:
+        logger.warning("No volume of %s reports its free space, use the first one", hostname)
+        return volumes[0]
+    return max(known, key=lambda volume: volume.free)
+
+
+def fewest_projects(hostname, volumes, dry_run=False):
+    return min(volumes, key=lambda volume: volume.projects)
+
+
+class ProcessCounters(object):
+    """
+    Counters only kept by this process, with the interface of DiskCache
+    """
+
+    def __init__(self):
+        self._values = defaultdict(int)
+        self._lock = threading.Lock()
+
+    def peek(self, server, name):
+        with self._lock:
+            return self._values[(server, name)]
+
+    def increment(self, server, name):
+        with self._lock:
+            value = self._values[(server, name)]
+            self._values[(server, name)] = value + 1
+            return value
+
+
+_process_counters = ProcessCounters()
+# store keeping the round-robin position of each server
+counters = _process_counters
+
+
+def use_counters(store):
+    """
+    Keep the round-robin positions in another store
+
+    :param store: object with the peek and increment methods of DiskCache, None for the process counters
+    :type store: DiskCache
+    """
+    global counters
+    counters = store if store is not None else _process_counters
+
+
+def round_robin(hostname, volumes, dry_run=False):
+    store = counters
+    try:
+        idx = store.peek(hostname, 'round-robin') if dry_run else store.increment(hostname, 'round-robin')
+    except (IOError, OSError) as e:
+        logger.warning("Unable to save round-robin position of %s, only kept by this process: %s", hostname, e)
+        store = _process_counters
+        idx = store.peek(hostname, 'round-robin') if dry_run else store.increment(hostname, 'round-robin')
+    return volumes[idx % len(volumes)]
+
+
+POLICIES = {
+    'first': first_volume,
+    'most-free': most_free_space,
+    'fewest-projects': fewest_projects,
+    'round-robin': round_robin,
+}
+
+
+def register_policy(name, policy):
+    """
+    Register a placement policy
+
+    :param name: name of the policy, ex: 'most-free'
+    :type name: string
+    :param policy: callable taking the hostname, a list of VolumeInfo and the dry_run flag, returning one of them
+    :type policy: callable
+    """
+    POLICIES[name] = policy
+
+
+def volume_infos(handler):
+    """
+    Usage of the volumes of a server, kept volume_info_ttl seconds by the handler
+
+    :param handler: handler connected to the server
+    :type handler: WiretapHandler
+    :return: a VolumeInfo per volume, in the order of get_volumes
+    :rtype: list
+    """
+    infos = []
+    for name in handler.get_volumes():
+        info = handler.volume_cache.get('volume', "/volumes/%s" % name)
+        if info is None:
+            info = VolumeInfo(handler, name)
+            handler.volume_cache.set('volume', info.path, info)
+        infos.append(info)
+    return infos
+
+
+def choose_volume(handler, placement='first', volume=None, dry_run=False):
+    """
+    Choose the volume of a new project
+
+    :param handler: handler connected to the server
+    :type handler: WiretapHandler
+    :param placement: name of the placement policy
+    :type placement: string
+    :param volume: volume to use, bypassing the policy
+    :type volume: string
+    :param dry_run: choose the volume without changing the state of the policy
+    :type dry_run: bool
+    :return: the chosen volume
+    :rtype: VolumeInfo
+    :raises WiretapException: if the server has no volume, or not the requested one
+    """
+    infos = volume_infos(handler)
+    if not infos:
+        raise WiretapException("Cannot create project! There is no volumes defined for this flame.")
+
+    if volume is not None:
+        for info in infos:
+            if info.name == volume:
+                return info
+        raise WiretapException("Volume %s not found on %s, available volumes: %s" % (
+            volume, handler.hostname, ", ".join(info.name for info in infos)))
+
+    try:
+        policy = POLICIES[placement]
+    except KeyError:
+        raise WiretapException("Unknown placement %s, available placements: %s" % (
+            placement, ", ".join(sorted(POLICIES))))
+    return policy(handler.hostname, infos, dry_run=dry_run)
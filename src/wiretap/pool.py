@@ -0,0 +1,183 @@
+# coding: utf-8
+
+import logging
+import threading
+
+
+logger = logging.getLogger(__name__)
+
+
+class ClientLifecycle(object):
+    """
+    Reference counted initialization of the Wiretap client API.
+
+    The client is initialized by the first user and uninitialized when the
+    last one releases it, so handlers living side by side do not tear down
+    each other's connection.
+    """
+
+    def __init__(self, init, uninit):
+        """
+
+        :param init: callable initializing the client, returns False on failure
+        :type init: callable
+        :param uninit: callable uninitializing the client
+        :type uninit: callable
+        """
+        self._init = init
+        self._uninit = uninit
+        self._count = 0
+        self._lock = threading.Lock()
+
+    @property
+    def count(self):
+        return self._count
+
+    def acquire(self):
+        """
+        Take a reference on the client, initializing it if needed
+
+        :return: False if the client can't be initialized
+        :rtype: bool
+        """
+        with self._lock:
+            if self._count == 0 and not self._init():
+                return False
+            self._count += 1
+            return True
+
+    def release(self):
+        """
+        Drop a reference on the client, uninitializing it with the last one
+        """
+        with self._lock:
+            if self._count == 0:
+                return
+            self._count -= 1
+            if self._count == 0:
+                self._uninit()
+
+
+class ServerPool(object):
+    """
+    Pool of server handles keyed by hostname.
+
+    Handles returned to the pool are kept open for the next borrower. While
+    the pool holds idle handles it keeps a reference on the client.
+    """
+
+    def __init__(self, factory, client, max_idle=8):
+        """
+
+        :param factory: callable opening a server handle for a hostname
+        :type factory: callable
+        :param client: client lifecycle the pool holds a reference on
+        :type client: ClientLifecycle
+        :param max_idle: maximum number of idle handles kept per hostname
+        :type max_idle: int
+        """
+        self._factory = factory
+        self._client = client
+        self.max_idle = max_idle
+        self._idle = dict()
+        self._holds_client = False
+        self._lock = threading.Lock()
+
+    def idle_count(self, hostname=None):
+        """
+        Number of idle handles in the pool, for a hostname or for all of them
+        """
+        with self._lock:
+            if hostname is not None:
+                return len(self._idle.get(hostname, []))
+            return sum(len(servers) for servers in self._idle.values())
+
+    def acquire(self, hostname):
+        """
+        Borrow a server handle, reusing an idle one if possible
+
+        :param hostname: Wiretap server to connect
+        :type hostname: string
+        :rtype: WireTapServerHandle
+        """
+        with self._lock:
+            servers = self._idle.get(hostname)
+            if servers:
+                logger.debug("Reuse server handle for %s", hostname)
+                return servers.pop()
+        logger.debug("Open server handle for %s", hostname)
+        return self._factory(hostname)
+
+    def release(self, hostname, server):
+        """
+        Return a borrowed server handle to the pool
+
+        :param hostname: Wiretap server of the handle
+        :type hostname: string
+        :param server: the borrowed handle
+        :type server: WireTapServerHandle
+        """
+        with self._lock:
+            servers = self._idle.setdefault(hostname, [])
+            if len(servers) >= self.max_idle:
+                return
+            if not self._holds_client:
+                if not self._client.acquire():
+                    return
+                self._holds_client = True
+            servers.append(server)
+
+    def clear(self, hostname=None):
+        """
+        Close idle handles, of a hostname or of all of them
+        """
+        with self._lock:
+            if hostname is not None:
+                self._idle.pop(hostname, None)
+            else:
+                self._idle.clear()
+            release = self._holds_client and not any(self._idle.values())
+            if release:
+                self._holds_client = False
+        if release:
+            self._client.release()
+
+
+class ThreadServers(object):
+    """
+    Server handles borrowed by the worker threads of a handler, one per thread.
+    """
+
+    def __init__(self, handler):
+        """
+
+        :param handler: handler whose server handles are borrowed
+        :type handler: WiretapHandler
+        """
+        self.handler = handler
+        self._local = threading.local()
+        self._servers = []
+        self._lock = threading.Lock()
+
+    def get(self):
+        """
+        Server handle of the calling thread, borrowed on first call
+
+        :rtype: WireTapServerHandle
+        """
+        server = getattr(self._local, 'server', None)
+        if server is None:
+            server = self._local.server = self.handler._new_server()
+            with self._lock:
+                self._servers.append(server)
+        return server
+
+    def release(self):
+        """
+        Give back all borrowed handles. Threads borrow a new one on their next call.
+        """
+        with self._lock:
+            servers, self._servers = self._servers, []
+            self._local = threading.local()
+        for server in servers:
+            self.handler._release_server(server)
@@ -0,0 +1,157 @@
+# coding: utf-8
+"""
+Idempotent creation of project library layouts.
+
+A layout describes the libraries of a library list and their folders, as
+loaded from the YAML file given to `create-project --libraries-file`:
+
+    LibA:
+      - Folder1
+      - Folder2
+    LibB:
+      Folder3: [SubFolder1, SubFolder2]
+    LibC:
+
+Each level of the existing tree is listed once and only the missing nodes
+are planned for creation.
+"""
+
+import logging
+
+from wiretap import WiretapException, WiretapNodeType
+from bulk import BulkNodeCreator, BulkCreateError, NodeSpec
+
+
+logger = logging.getLogger(__name__)
+
+
+def _entries(layout):
+    """
+    Normalize a layout level into (name, sub layout) pairs
+    """
+    if not layout:
+        return []
+    if isinstance(layout, dict):
+        return [(str(name), children) for (name, children) in layout.items()]
+    if isinstance(layout, (list, tuple)):
+        entries = []
+        for item in layout:
+            if isinstance(item, dict):
+                entries.extend(_entries(item))
+            else:
+                entries.append((str(item), None))
+        return entries
+    return [(str(layout), None)]
+
+
+def _specs(layout, node_type):
+    return [
+        NodeSpec(name, node_type, _specs(children, WiretapNodeType.Folder))
+        for (name, children) in _entries(layout)]
+
+
+class Plan(object):
+    """Nodes missing from a library layout, grouped by existing parent node"""
+
+    def __init__(self):
+        # (parent path, parent display path, NodeSpec)
+        self.items = []
+
+    def __len__(self):
+        return sum(spec.count() for (_, _, spec) in self.items)
+
+    def __iter__(self):
+        """
+        Iterate over the nodes to create, parents first
+
+        :return: (display path, node type) tuples
+        :rtype: generator
+        """
+        for (_, location, spec) in self.items:
+            stack = [(location, spec)]
+            while stack:
+                parent_location, current = stack.pop(0)
+                current_location = "%s/%s" % (parent_location, current.name)
+                yield (current_location, current.node_type)
+                stack[0:0] = [(current_location, child) for child in current.children]
+
+    def add(self, parent_path, parent_location, spec):
+        self.items.append((parent_path, parent_location, spec))
+
+    def apply(self, handler, workers=8):
+        """
+        Create the missing nodes
+
+        :param handler: handler connected to the server
+        :type handler: WiretapHandler
+        :param workers: maximum number of nodes created concurrently
+        :type workers: int
+        :raises BulkCreateError: with the failures of all parents
+        """
+        by_parent = dict()
+        order = []
+        for (parent_path, _, spec) in self.items:
+            if parent_path is None:
+                raise WiretapException("Cannot apply a plan made without the project")
+            if parent_path not in by_parent:
+                by_parent[parent_path] = []
+                order.append(parent_path)
+            by_parent[parent_path].append(spec)
+
+        failures = []
+        creator = BulkNodeCreator(handler, workers=workers)
+        for parent_path in order:
+            try:
+                creator.create(parent_path, by_parent[parent_path])
+            except BulkCreateError as e:
+                failures.extend(e.failures)
+        if failures:
+            raise BulkCreateError(failures, [])
+
+
+def plan_libraries(handler, project_node, library_name, layout):
+    """
+    Compute the nodes to create for a library layout to exist in a project.
+
+    :param handler: handler connected to the server
+    :type handler: WiretapHandler
+    :param project_node: project node handler, None if the project does not
+        exist yet: then every node is planned
+    :type project_node: WireTapNodeHandle
+    :param library_name: name of the library list
+    :type library_name: string
+    :param layout: libraries and folders to create
+    :type layout: dict
+    :rtype: Plan
+    :raises WiretapException: if the library list does not exist in the project
+    """
+    plan = Plan()
+    if project_node is None:
+        for spec in _specs(layout, WiretapNodeType.Library):
+            plan.add(None, library_name, spec)
+        return plan
+
+    library_list = handler._get_node(project_node, library_name, WiretapNodeType.LibraryList)
+    if library_list is None:
+        raise WiretapException("Library list %s not found in project" % library_name)
+
+    # (existing node path, display path, wanted children, children type)
+    levels = [(handler._node_path(library_list), library_name, layout, WiretapNodeType.Library)]
+    while levels:
+        parent_path, location, wanted, node_type = levels.pop(0)
+        entries = _entries(wanted)
+        if not entries:
+            continue
+
+        existing = dict()
+        for (name, child_type, child_path) in handler._list_children(parent_path):
+            existing.setdefault((name, child_type), child_path)
+
+        for (name, children) in entries:
+            child_path = existing.get((name, node_type))
+            if child_path is None:
+                plan.add(parent_path, location, NodeSpec(
+                    name, node_type, _specs(children, WiretapNodeType.Folder)))
+            else:
+                levels.append((child_path, "%s/%s" % (location, name), children, WiretapNodeType.Folder))
+    return plan
@@ -0,0 +1,122 @@
+# coding: utf-8
+"""
+Concurrent search of nodes by name and type.
+"""
+
+import re
+import Queue
+import fnmatch
+import logging
+import threading
+from multiprocessing.pool import ThreadPool
+
+from wiretap import WiretapNodeType
+from index import descendant_types, may_contain
+from pool import ThreadServers
+
+
+logger = logging.getLogger(__name__)
+
+
+def name_matcher(pattern, regex=False, ignore_case=False):
+    """
+    Build a function matching node names
+
+    :param pattern: glob pattern matching the whole name, or regular
+        expression searched in the name
+    :type pattern: string
+    :param regex: whether the pattern is a regular expression
+    :type regex: bool
+    :param ignore_case: match names regardless of case
+    :type ignore_case: bool
+    :rtype: callable
+    """
+    flags = re.IGNORECASE if ignore_case else 0
+    if regex:
+        return re.compile(pattern, flags).search
+    return re.compile(fnmatch.translate(pattern), flags).match
+
+
+def find(handler, pattern='*', path='/', node_types=None, regex=False, ignore_case=False,
+         limit=None, max_depth=None, workers=8):
+    """
+    Search nodes breadth first, listing nodes concurrently.
+    Nodes which can't contain any of the searched types are not listed.
+
+    :param handler: handler connected to the server
+    :type handler: WiretapHandler
+    :param pattern: glob pattern, or regular expression if regex is set
+    :type pattern: string
+    :param path: path of the node to search from
+    :type path: string
+    :param node_types: only find nodes of these types
+    :type node_types: list
+    :param regex: whether the pattern is a regular expression
+    :type regex: bool
+    :param ignore_case: match names regardless of case
+    :type ignore_case: bool
+    :param limit: stop after this number of matches, None for all
+    :type limit: int
+    :param max_depth: how deep to search, 1 for the children only, None for no limit
+    :type max_depth: int
+    :param workers: number of nodes listed at the same time
+    :type workers: int
+    :return: (path, name, type, display path) tuples, in the order they are found
+    :rtype: generator
+    """
+    match = name_matcher(pattern, regex=regex, ignore_case=ignore_case)
+    node_types = set(node_types) if node_types else None
+    if (limit is not None and limit < 1) or (max_depth is not None and max_depth < 1):
+        return
+
+    def search_into(node_type):
+        if node_types is None:
+            # leaf types have no children to list
+            return descendant_types(node_type) != frozenset()
+        return any(may_contain(node_type, t) for t in node_types)
+
+    servers = ThreadServers(handler)
+    results = Queue.Queue()
+    stopped = threading.Event()
+
+    def list_node(node_path, location, depth):
+        if stopped.is_set():
+            results.put((location, depth, [], None))
+            return
+        try:
+            results.put((location, depth, handler._read_children(node_path, server=servers.get()), None))
+        except Exception as e:
+            results.put((location, depth, None, e))
+
+    pool = ThreadPool(max(1, workers))
+    found = 0
+    try:
+        pending = 1
+        pool.apply_async(list_node, (path, path.rstrip('/'), 0))
+        while pending:
+            location, depth, children, error = results.get()
+            pending -= 1
+            if error is not None:
+                logger.error("Unable to list %s: %s", location or '/', error)
+                continue
+
+            for (name, node_type, child_path) in children:
+                child_location = "%s/%s" % (location, name)
+                if (node_types is None or node_type in node_types) and match(name):
+                    yield (child_path, name, node_type, child_location)
+                    found += 1
+                    if limit is not None and found >= limit:
+                        return
+
+                # projects of a volume are found under /projects
+                if (node_type == WiretapNodeType.Volume and depth > 0) or not search_into(node_type):
+                    continue
+                if max_depth is not None and depth + 1 >= max_depth:
+                    continue
+                pending += 1
+                pool.apply_async(list_node, (child_path, child_location, depth + 1))
+    finally:
+        stopped.set()
+        pool.close()
+        pool.join()
+        servers.release()
@@ -0,0 +1,209 @@
+# coding: utf-8
+"""
+Snapshots of a Wiretap database.
+
+A snapshot is a JSON Lines file, optionally gzip compressed. The first line
+is a header describing the snapshot, followed by one line per node and a
+summary line:
+
+    {"format": "wiretap-snapshot", "version": 1, "server": "flame01", "root": "/", ...}
+    {"path": "/projects/MY_PROJECT", "id": "/projects/MY_PROJECT", "type": "PROJECT", "xml": "<Project>..."}
+    {"summary": {"nodes": 1234, "errors": 0}}
+
+`path` is built from display names so that snapshots of different servers
+can be compared, `id` is the Wiretap node id.
+"""
+
+import sys
+import gzip
+import json
+import time
+import Queue
+import hashlib
+import logging
+from multiprocessing.pool import ThreadPool
+
+from wiretap import WiretapException, WiretapNodeType
+from pool import ThreadServers
+
+
+logger = logging.getLogger(__name__)
+
+FORMAT = 'wiretap-snapshot'
+VERSION = 1
+
+# Node types whose XML metadata is saved in snapshots
+METADATA_NODE_TYPES = (WiretapNodeType.Project,)
+
+
+def open_snapshot(filename, mode='r', compress=None):
+    """
+    Open a snapshot file, gzip compressed if its name ends with .gz.
+    '-' stands for the standard input or output.
+
+    :param filename: snapshot file name
+    :type filename: string
+    :param mode: 'r' or 'w'
+    :type mode: string
+    :param compress: force compression on or off, guessed from the name if None
+    :type compress: bool
+    :rtype: file
+    """
+    if filename == '-':
+        return sys.stdin if mode == 'r' else sys.stdout
+    if compress is None:
+        compress = filename.endswith('.gz')
+    if compress:
+        return gzip.open(filename, mode + 'b')
+    return open(filename, mode)
+
+
+def _write(output, record):
+    output.write(json.dumps(record, sort_keys=True, separators=(',', ':')))
+    output.write('\n')
+
+
+def dump(handler, output, path='/', workers=8, metadata=True, max_depth=None):
+    """
+    Crawl the node tree of a server and write it as a snapshot.
+    Nodes are listed concurrently and written as soon as they are read.
+
+    :param handler: handler connected to the server
+    :type handler: WiretapHandler
+    :param output: file to write the snapshot to
+    :type output: file
+    :param path: node to crawl from
+    :type path: string
+    :param workers: number of nodes listed at the same time
+    :type workers: int
+    :param metadata: save XML metadata of projects
+    :type metadata: bool
+    :param max_depth: how deep to crawl, None for no limit
+    :type max_depth: int
+    :return: number of nodes and of errors
+    :rtype: dict
+    """
+    start = time.time()
+    servers = ThreadServers(handler)
+    results = Queue.Queue()
+
+    def list_node(node_path, location, node_type, depth):
+        server = servers.get()
+        # projects of a volume are the ones of /projects, read their metadata once
+        read_metadata = metadata and node_type != WiretapNodeType.Volume
+        try:
+            children = []
+            for (name, child_type, child_path) in handler._read_children(node_path, server=server):
+                xml = None
+                if read_metadata and child_type in METADATA_NODE_TYPES:
+                    xml = handler._read_metadata(child_path, server=server)
+                children.append((name, child_type, child_path, xml))
+            results.put((node_path, location, node_type, depth, children, None))
+        except Exception as e:
+            results.put((node_path, location, node_type, depth, None, e))
+
+    _write(output, {
+        'format': FORMAT, 'version': VERSION, 'server': handler.hostname, 'root': path,
+        'date': time.strftime('%Y-%m-%dT%H:%M:%S')})
+
+    pool = ThreadPool(max(1, workers))
+    nodes = errors = 0
+    seen = set([path])
+    try:
+        pending = 1
+        pool.apply_async(list_node, (path, path.rstrip('/'), None, 0))
+        while pending:
+            node_path, location, parent_type, depth, children, error = results.get()
+            pending -= 1
+            if error is not None:
+                errors += 1
+                logger.error("Unable to list %s: %s", location or '/', error)
+                _write(output, {'path': location or '/', 'id': node_path, 'error': str(error)})
+                continue
+
+            for (name, node_type, child_path, xml) in children:
+                child_location = "%s/%s" % (location, name)
+                record = {'path': child_location, 'id': child_path, 'type': node_type}
+                if xml is not None:
+                    record['xml'] = xml
+                _write(output, record)
+                nodes += 1
+
+                # projects are listed under /projects and under their volume,
+                # only crawl them from /projects so that paths are stable
+                if parent_type == WiretapNodeType.Volume or child_path in seen:
+                    continue
+                if max_depth is not None and depth + 1 >= max_depth:
+                    continue
+                seen.add(child_path)
+                pending += 1
+                pool.apply_async(list_node, (child_path, child_location, node_type, depth + 1))
+    finally:
+        pool.close()
+        pool.join()
+        servers.release()
+
+    summary = {'nodes': nodes, 'errors': errors, 'seconds': round(time.time() - start, 3)}
+    _write(output, {'summary': summary})
+    return summary
+
+
+def read(snapshot):
+    """
+    Iterate over the node records of a snapshot
+
+    :param snapshot: snapshot file
+    :type snapshot: file
+    :return: node records
+    :rtype: generator
+    :raises WiretapException: if the file is not a snapshot
+    """
+    header = None
+    for line in snapshot:
+        if not line.strip():
+            continue
+        record = json.loads(line)
+        if header is None:
+            if record.get('format') != FORMAT:
+                raise WiretapException("Not a Wiretap snapshot")
+            header = record
+            continue
+        if 'summary' in record or 'error' in record:
+            continue
+        yield record
+
+
+def _digest(record):
+    xml = record.get('xml')
+    if xml is None:
+        return None
+    return hashlib.sha1(xml.encode('utf-8')).hexdigest()
+
+
+def diff(old, new):
+    """
+    Compare two snapshots. Nodes are matched by path and type, only the
+    first snapshot is held in memory.
+
+    :param old: first snapshot
+    :type old: file
+    :param new: second snapshot
+    :type new: file
+    :return: ('+', path, type) for added nodes, ('-', path, type) for removed
+        ones and ('~', path, type) for nodes whose metadata changed
+    :rtype: generator
+    """
+    known = dict()
+    for record in read(old):
+        known[(record['path'], record['type'])] = _digest(record)
+
+    for record in read(new):
+        key = (record['path'], record['type'])
+        if key not in known:
+            yield ('+',) + key
+            continue
+        if known.pop(key) != _digest(record):
+            yield ('~',) + key
+
+    for key in sorted(known.keys()):
+        yield ('-',) + key
@@ -0,0 +1,101 @@
+# coding: utf-8
+"""
+Update of the settings of many projects.
+
+The XML metadata of every matching project is read and compared with the
+requested settings. Only projects with a setting to change are written, the
+other ones cost a single metadata read.
+"""
+
+import time
+import logging
+from multiprocessing.pool import ThreadPool
+
+from pool import ThreadServers
+from search import name_matcher
+
+
+logger = logging.getLogger(__name__)
+
+
+class ProjectUpdate(object):
+    """Outcome of the update of one project"""
+
+    def __init__(self, name, changes=None, error=None, elapsed=0.0):
+        """
+
+        :param name: project name
+        :type name: string
+        :param changes: changed settings, ex: {'SetupDir': ('/old/setups', '/new/setups')}
+        :type changes: dict
+        :param error: exception raised by the update, None on success
+        :type error: Exception
+        :param elapsed: duration of the update in seconds
+        :type elapsed: float
+        """
+        self.name = name
+        self.changes = changes or dict()
+        self.error = error
+        self.elapsed = elapsed
+
+    @property
+    def ok(self):
+        return self.error is None
+
+    @property
+    def changed(self):
+        return self.ok and bool(self.changes)
+
+    def __repr__(self):
+        if self.ok:
+            return "ProjectUpdate(%r, %r)" % (self.name, self.changes)
+        return "ProjectUpdate(%r, error=%r)" % (self.name, self.error)
+
+
+def update_projects(handler, pattern, settings, regex=False, ignore_case=False, workers=8, dry_run=False):
+    """
+    Change some settings of every project matching a pattern
+
+    :param handler: handler connected to the server
+    :type handler: WiretapHandler
+    :param pattern: glob pattern, or regular expression if regex is set
+    :type pattern: string
+    :param settings: settings to change, None values remove the setting
+    :type settings: dict
+    :param regex: whether the pattern is a regular expression
+    :type regex: bool
+    :param ignore_case: match names regardless of case
+    :type ignore_case: bool
+    :param workers: number of projects updated at the same time
+    :type workers: int
+    :param dry_run: only compute the changes
+    :type dry_run: bool
+    :return: a ProjectUpdate per matching project, in completion order
+    :rtype: generator
+    """
+    match = name_matcher(pattern, regex=regex, ignore_case=ignore_case)
+    project_names = [name for name in handler.get_projects() if match(name)]
+    if not project_names:
+        return
+
+    servers = ThreadServers(handler)
+
+    def update(project_name):
+        start = time.time()
+        try:
+            handler._bind_server(servers.get())
+            changes = handler.update_project_settings(project_name, settings, dry_run=dry_run)
+            return ProjectUpdate(project_name, changes, elapsed=time.time() - start)
+        except Exception as e:
+            return ProjectUpdate(project_name, error=e, elapsed=time.time() - start)
+
+    pool = ThreadPool(max(1, min(workers, len(project_names))))
+    try:
+        for result in pool.imap_unordered(update, project_names):
+            if not result.ok:
+                logger.debug("Update of %s failed after %.2fs: %s", result.name, result.elapsed, result.error)
+            yield result
+    finally:
+        pool.close()
+        pool.join()
+        servers.release()
@@ -0,0 +1,181 @@
+# coding: utf-8
+"""
+Incremental polling of node trees for created and deleted nodes.
+
+The watcher keeps the children of every watched node from one poll to the
+next. On each poll it only asks the number of children of each node, level
+by level, and lists again the nodes whose count changed. Every few polls all
+nodes are listed, to notice a node replaced by another one between two polls.
+"""
+
+import time
+import logging
+from multiprocessing.pool import ThreadPool
+
+from wiretap import WiretapException
+from pool import ThreadServers
+from backend import wt
+
+
+logger = logging.getLogger(__name__)
+
+
+class _Entry(object):
+    """Children of a watched node as of the last poll"""
+
+    __slots__ = ('location', 'depth', 'count', 'children')
+
+    def __init__(self, location, depth, count, children):
+        self.location = location
+        self.depth = depth
+        self.count = count
+        # child path: (name, type)
+        self.children = children
+
+
+class Watcher(object):
+    """
+    Report nodes created and deleted below some nodes of a server
+    """
+
+    def __init__(self, handler, paths=('/projects', '/users'), max_depth=1,
+                 min_interval=1.0, max_interval=60.0, verify_every=10, workers=8):
+        """
+
+        :param handler: handler connected to the server
+        :type handler: WiretapHandler
+        :param paths: paths of the watched nodes
+        :type paths: list
+        :param max_depth: how deep to watch, 1 for the children of the watched nodes only
+        :type max_depth: int
+        :param min_interval: delay in seconds between polls after a change
+        :type min_interval: float
+        :param max_interval: longest delay in seconds between polls when nothing changes
+        :type max_interval: float
+        :param verify_every: list all nodes every this number of polls, 0 to only rely on counts
+        :type verify_every: int
+        :param workers: number of nodes polled at the same time
+        :type workers: int
+        """
+        self.handler = handler
+        self.paths = list(paths)
+        self.max_depth = max(1, max_depth)
+        self.min_interval = min_interval
+        self.max_interval = max(min_interval, max_interval)
+        self.verify_every = verify_every
+        self.workers = workers
+        self.interval = min_interval
+        self.polls = 0
+        self._entries = dict()
+
+    def _probe(self, servers, path, entry, verify):
+        """
+        Count the children of a node, listing them if they may have changed
+
+        :return: (path, count, children or None, error)
+        :rtype: tuple
+        """
+        server = servers.get()
+        try:
+            node = wt.WireTapNodeHandle(server, path)
+            num_children = wt.WireTapInt(0)
+            if not node.getNumChildren(num_children):
+                raise WiretapException("Unable to obtain number of children: %s" % node.lastError())
+            count = int(num_children)
+            children = None
+            if entry is None or verify or count != entry.count:
+                children = self.handler._read_children(path, server=server)
+            return (path, count, children, None)
+        except Exception as e:
+            return (path, None, None, e)
+
+    def _forget(self, path):
+        entry = self._entries.pop(path, None)
+        if entry is not None:
+            for child_path in entry.children:
+                self._forget(child_path)
+
+    def _event(self, event, location, path, node_type):
+        return {
+            'event': event, 'server': self.handler.hostname, 'path': location, 'id': path,
+            'type': node_type, 'time': time.strftime('%Y-%m-%dT%H:%M:%S')}
+
+    def poll(self):
+        """
+        Compare the watched nodes with the previous poll. The first poll only
+        reads them.
+
+        :return: created and deleted events, ex: {'event': 'created', 'path': '/projects/A', ...}
+        :rtype: list
+        """
+        verify = self.verify_every and self.polls and self.polls % self.verify_every == 0
+        self.polls += 1
+        events = []
+        level = [(path, path.rstrip('/'), 0) for path in self.paths]
+        servers = ThreadServers(self.handler)
+        pool = ThreadPool(max(1, self.workers))
+        try:
+            while level:
+                locations = dict((path, (location, depth)) for (path, location, depth) in level)
+                results = pool.map(
+                    lambda item: self._probe(servers, item[0], self._entries.get(item[0]), verify), level)
+
+                next_level = []
+                for (path, count, children, error) in results:
+                    location, depth = locations[path]
+                    if error is not None:
+                        # a deleted node is reported with its parent
+                        log = logger.error if depth == 0 else logger.debug
+                        log("Unable to poll %s: %s", location or '/', error)
+                        continue
+
+                    entry = self._entries.get(path)
+                    if children is not None:
+                        current = dict((child_path, (name, node_type)) for (name, node_type, child_path) in children)
+                        if entry is not None:
+                            for (child_path, (name, node_type)) in current.items():
+                                if child_path not in entry.children:
+                                    events.append(self._event('created', "%s/%s" % (location, name), child_path, node_type))
+                            for (child_path, (name, node_type)) in entry.children.items():
+                                if child_path not in current:
+                                    events.append(self._event('deleted', "%s/%s" % (location, name), child_path, node_type))
+                                    self._forget(child_path)
+                            if set(current) != set(entry.children):
+                                self.handler.invalidate(path)
+                        entry = self._entries[path] = _Entry(location, depth, count, current)
+
+                    if depth + 1 < self.max_depth:
+                        for (child_path, (name, _)) in entry.children.items():
+                            next_level.append((child_path, "%s/%s" % (location, name), depth + 1))
+                level = next_level
+        finally:
+            pool.close()
+            pool.join()
+            servers.release()
+
+        if events:
+            self.interval = self.min_interval
+        else:
+            self.interval = min(self.max_interval, self.interval * 1.5)
+        return events
+
+    def run(self, polls=None):
+        """
+        Poll until interrupted, waiting longer between polls while nothing changes
+
+        :param polls: number of polls, None for no limit
+        :type polls: int
+        :return: events, as they are found
+        :rtype: generator
+        """
+        count = 0
+        while polls is None or count < polls:
+            if count:
+                time.sleep(self.interval)
+            count += 1
+            start = time.time()
+            events = self.poll()
+            logger.debug("Poll %d of %s: %d event(s) in %.3fs, next in %.1fs",
+                         self.polls, self.handler.hostname, len(events), time.time() - start, self.interval)
+            for event in events:
+                yield event
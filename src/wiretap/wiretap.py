@@ -2,30 +2,30 @@
 
 import os
 import sys
-import imp
+import atexit
 import platform
 import logging
 import pprint
+import threading
 import xml.dom.minidom as minidom
+import xml.etree.cElementTree as ElementTree
+from xml.sax.saxutils import escape
+from multiprocessing.pool import ThreadPool
+
+from cache import NodeCache
+from index import NodeIndex, may_contain
+from pool import ClientLifecycle, ServerPool, ThreadServers
+from backend import wt, import_wiretap_library, DISCREET_PATH, WIRETAP_DEFAULT_VERSION, WIRETAP_VERSION
 
 
-DISCREET_PATH = "/usr/discreet"
-WIRETAP_DEFAULT_VERSION = "2018.3"
-WIRETAP_VERSION = os.environ.get('WIRETAP_VERSION', WIRETAP_DEFAULT_VERSION)
 # logging.basicConfig(level=logging.DEBUG)
 logger = logging.getLogger(__name__)
-wt = None
-
 
-def import_wiretap_library(version=WIRETAP_VERSION):
-    logger.info('Use Wiretap version %s.' % version)
-    library_path = os.path.join(
-        DISCREET_PATH, 'python', version, 'lib', 'python2.7', 'site-packages', 'adsk',
-        'libwiretapPythonClientAPI.so')
-    return imp.load_dynamic('libwiretapPythonClientAPI', library_path)
 
-
-wt = import_wiretap_library()
+# Client API initialization and server handles shared by all handlers
+_client = ClientLifecycle(lambda: wt.WireTapClientInit(), lambda: wt.WireTapClientUninit())
+_servers = ServerPool(lambda hostname: wt.WireTapServerHandle(hostname), _client)
+atexit.register(_servers.clear)
 
 
 class WiretapException(Exception):
@@ -43,34 +43,216 @@ class WiretapNodeType:
     Folder = 'FOLDER'
     Library = 'LIBRARY'
     LibraryList = 'LIBRARY_LIST'
+    ReelGroup = 'REEL_GROUP'
+    Reel = 'REEL'
+    Clip = 'CLIP'
+
+
+def parse_project_xml(xml):
+    """
+    Parse the XML metadata of a project
+
+    :param xml: the project XML metadata
+    :type xml: string
+    :return: project settings, ex: {'FrameWidth': '1920', 'FrameRate': '25 fps', ...}
+    :rtype: dict
+    :raises WiretapException: if the XML can't be parsed
+    """
+    if not xml.strip():
+        return dict()
+    try:
+        root = ElementTree.fromstring(xml)
+    except SyntaxError as e:
+        raise WiretapException("Invalid project metadata: %s" % e)
+    return _element_to_dict(root)
+
+
+def _element_to_dict(element):
+    settings = dict()
+    for child in element:
+        if len(child):
+            settings[child.tag] = _element_to_dict(child)
+        else:
+            settings[child.tag] = (child.text or '').strip()
+    return settings
+
+
+def build_project_xml(settings):
+    """
+    Build the XML metadata of a project, the reverse of parse_project_xml
+
+    :param settings: project settings, nested dicts for nested elements
+    :type settings: dict
+    :return: XML metadata, ex: '<Project><FrameRate>25 fps</FrameRate></Project>'
+    :rtype: string
+    """
+    return '<Project>%s</Project>' % _dict_to_xml(settings)
+
+
+def _dict_to_xml(settings):
+    xml = ''
+    for (k, v) in settings.iteritems():
+        value = _dict_to_xml(v) if isinstance(v, dict) else escape('%s' % v)
+        xml += '<%s>%s</%s>' % (k, value, k)
+    return xml
+
+
+def update_project_xml(xml, settings):
+    """
+    Apply settings to the XML metadata of a project. Elements not in the
+    settings are kept as they are.
+
+    :param xml: current XML metadata of the project
+    :type xml: string
+    :param settings: settings to change, nested dicts for nested elements,
+        None values remove the element
+    :type settings: dict
+    :return: the new XML metadata, None if no setting changes, and the changes,
+        ex: {'SetupDir': ('/old/setups', '/new/setups')}
+    :rtype: tuple
+    :raises WiretapException: if the XML can't be parsed
+    """
+    if not xml.strip():
+        xml = '<Project></Project>'
+    try:
+        root = ElementTree.fromstring(xml)
+    except SyntaxError as e:
+        raise WiretapException("Invalid project metadata: %s" % e)
+    changes = dict()
+    _update_element(root, settings, changes, '')
+    if not changes:
+        return None, changes
+    return ElementTree.tostring(root), changes
+
+
+def _update_element(element, settings, changes, prefix):
+    for (key, value) in settings.iteritems():
+        child = element.find(key)
+        name = prefix + key
+        if value is None:
+            if child is not None:
+                element.remove(child)
+                changes[name] = (_element_value(child), None)
+            continue
+        if child is None:
+            child = ElementTree.SubElement(element, key)
+            if not isinstance(value, dict):
+                child.text = '%s' % value
+                changes[name] = (None, child.text)
+                continue
+        if isinstance(value, dict):
+            _update_element(child, value, changes, name + '/')
+        elif len(child) or (child.text or '').strip() != ('%s' % value).strip():
+            changes[name] = (_element_value(child), '%s' % value)
+            for grandchild in list(child):
+                child.remove(grandchild)
+            child.text = '%s' % value
+
+
+def _element_value(element):
+    if len(element):
+        return _element_to_dict(element)
+    return (element.text or '').strip()
+
+
+# Maximum number of subtree indexes kept by a handler
+MAX_INDEXES = 64
+
+# Preference nodes created for each user
+USER_NODES = [
+    '2dtransform', '3dblur', 'CreatedBy', 'action', 'audio', 'automatte',
+    'autostabilize', 'average', 'batch', 'batchclip', 'blur', 'bumpDisplace',
+    'burnin', 'burnmetadata', 'channelEditor', 'check', 'clamp', 'colourframe',
+    'colourpicker', 'colourwarper', 'combine', 'comp', 'composite', 'compound',
+    'correct', 'damage', 'deal', 'deform', 'degrain', 'deinterlace',
+    'deliverables', 'denoise', 'depthOfField', 'desktop', 'difference',
+    'dissolve', 'distort', 'dve', 'edgeDetect', 'editdesk', 'exposure',
+    'fieldmerge', 'filter', 'flip', 'gatewayImport', 'glow', 'gradient',
+    'guides', 'hotkey', 'interlace', 'keyerChannel', 'keyerHLS', 'keyerRGB',
+    'keyerRGBCMYL', 'keyerYUV', 'letterbox', 'logicop', 'logo', 'look',
+    'lut', 'mapConvert', 'mask', 'matchbox', 'mediaImport', 'modularKeyer',
+    'mono', 'morf', 'motif', 'motionAnalyse', 'motionBlur', 'paint',
+    'pixelspread', 'play', 'posterize', 'pulldown', 'pybox', 'recursiveOps',
+    'regrain', 'resize', 'separate', 'stabilizer', 'status', 'stereo',
+    'stereoAnaglyph', 'stereoInterlace', 'stereoToolbox', 'stylize',
+    'substance', 'tangentPanel', 'text', 'timewarp', 'tmp', 'vectorViewer', 'viewing']
 
 
 class WiretapHandler(object):
 
-    def __init__(self, hostname='localhost'):
+    def __init__(self, hostname='localhost', cache_size=1024, cache_ttl=None, volume_info_ttl=10.0):
         """
 
         :param hostname:
         :type hostname: string
+        :param cache_size: maximum number of node lookups kept in cache, 0 to disable it
+        :type cache_size: int
+        :param cache_ttl: lifetime in seconds of cached lookups, None to keep them until invalidated
+        :type cache_ttl: float
+        :param volume_info_ttl: lifetime in seconds of the volume usage read to place projects
+        :type volume_info_ttl: float
         """
         self.hostname = hostname
+        self.cache = NodeCache(max_size=cache_size, ttl=cache_ttl)
+        self.volume_cache = NodeCache(max_size=256, ttl=volume_info_ttl)
+        # subtree indexes of _get_node, expiring like node lookups
+        self._indexes = NodeCache(max_size=MAX_INDEXES, ttl=cache_ttl)
+        self._project_settings = dict()
+        self._project_settings_lock = threading.Lock()
+        self._thread = threading.local()
+
+        self._main_server = None
 
         # Initialize wiretap connection
-        if not wt.WireTapClientInit():
+        if not _client.acquire():
             msg = "Unable to initialize WireTap client API"
             logger.critical(msg)
             raise WiretapException(msg)
 
-        self._server = wt.WireTapServerHandle(hostname)
+        self._main_server = _servers.acquire(hostname)
 
     def __del__(self):
         """
-        Delete server objet and uninitialize connection with the server
+        Return server objet to the pool and release the client API
+        """
+        self.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        """
+        Return server objet to the pool and release the client API.
+        The handler can't be used anymore afterwards.
+        """
+        if self._main_server is not None:
+            _servers.release(self.hostname, self._main_server)
+            self._main_server = None
+            self.clear_cache()
+            _client.release()
+
+    @property
+    def _server(self):
+        """
+        Server handle of the calling thread, the handler one unless the
+        thread bound its own with _bind_server
+        """
+        return getattr(self._thread, 'server', None) or self._main_server
+
+    def _bind_server(self, server):
         """
-        self._server = None
-        wt.WireTapClientUninit()
+        Make the calling thread use its own server handle, so that threads
+        can share the handler and its caches.
 
-    def create_project(self, project_name, settings={}):
+        :param server: server handle borrowed with _new_server, None to use the handler one again
+        :type server: WireTapServerHandle
+        """
+        self._thread.server = server
+
+    def create_project(self, project_name, settings={}, volume=None, placement='first'):
         """
         Create a Flame Family project.
 
@@ -78,6 +260,10 @@ class WiretapHandler(object):
         :type project_name: string
         :params settings: The settings of the project to create
         :type settings: dict
+        :param volume: volume to create the project on, chosen by the placement policy if None
+        :type volume: string
+        :param placement: policy choosing the volume: 'first', 'most-free', 'fewest-projects' or 'round-robin'
+        :type placement: string
         :return: project node
         :rtype: WireTapNodeHandle
         """
@@ -85,68 +271,70 @@ class WiretapHandler(object):
         if not self._child_node_exists("/projects", project_name, WiretapNodeType.Project):
             logger.info("Project '%s' does not exists. Create it with settings: \n%s" % (project_name, pprint.pformat(settings)))
 
-            volumes = self.get_volumes()
-            logger.debug("Framestore found: %s" % volumes)
-
-            if len(volumes) == 0:
-                raise Exception("Cannot create project! There is no volumes defined for this flame.")
-
-            # use the first volume available
-            volume_node = self._get_node_from_path("/volumes/%s" % volumes[0])
+            volume_info = self.choose_volume(placement=placement, volume=volume)
+            logger.info("Project '%s' placed on volume %s, %s" % (
+                project_name, volume_info, "as requested" if volume is not None else "by %s placement" % placement))
+            volume_node = self._get_node_from_path(volume_info.path)
 
             if not volume_node:
                 raise WiretapException("Unable to retrieve a volume.")
             else:
                 self._create_node(volume_node, WiretapNodeType.Node, project_name)
+                self.cache.invalidate('/projects')
+                self.volume_cache.invalidate(volume_info.path)
 
                 # create project settings
-                xml = '<Project>'
-                for (k, v) in settings.iteritems():
-                    xml += '<%s>%s</%s>' % (k, v, k)
-                xml += '</Project>'
+                xml = build_project_xml(settings)
 
                 project_node = wt.WireTapNodeHandle(self._server, "/projects/%s" % project_name)
                 if not project_node.setMetaData("XML", xml):
                     raise WiretapException("Error setting metadata for %s: %s" % (project_name, project_node.lastError()))
+                with self._project_settings_lock:
+                    self._project_settings.pop(project_name, None)
 
                 workspace_node = self._create_node(project_node, WiretapNodeType.Workspace)
                 self._create_node(workspace_node, WiretapNodeType.Desktop)
 
                 return project_node
 
-    def create_user(self, user_name):
+    def create_user(self, user_name, workers=8):
         """
         Create a Flame Family user.
 
         :param user_name: The username to create
         :type user_name: string
+        :param workers: maximum number of nodes created concurrently
+        :type workers: int
         :return: user node
         :rtype: WireTapNodeHandle
+        :raises BulkCreateError: if some nodes of the user can't be created
         """
-        users = wt.WireTapNodeHandle(self._server, "/users")
-        user_node = self._create_node(users, WiretapNodeType.User, user_name)
-
-        user_nodes = [
-            '2dtransform', '3dblur', 'CreatedBy', 'action', 'audio', 'automatte',
-            'autostabilize', 'average', 'batch', 'batchclip', 'blur', 'bumpDisplace',
-            'burnin', 'burnmetadata', 'channelEditor', 'check', 'clamp', 'colourframe',
-            'colourpicker', 'colourwarper', 'combine', 'comp', 'composite', 'compound',
-            'correct', 'damage', 'deal', 'deform', 'degrain', 'deinterlace',
-            'deliverables', 'denoise', 'depthOfField', 'desktop', 'difference',
-            'dissolve', 'distort', 'dve', 'edgeDetect', 'editdesk', 'exposure',
-            'fieldmerge', 'filter', 'flip', 'gatewayImport', 'glow', 'gradient',
-            'guides', 'hotkey', 'interlace', 'keyerChannel', 'keyerHLS', 'keyerRGB',
-            'keyerRGBCMYL', 'keyerYUV', 'letterbox', 'logicop', 'logo', 'look',
-            'lut', 'mapConvert', 'mask', 'matchbox', 'mediaImport', 'modularKeyer',
-            'mono', 'morf', 'motif', 'motionAnalyse', 'motionBlur', 'paint',
-            'pixelspread', 'play', 'posterize', 'pulldown', 'pybox', 'recursiveOps',
-            'regrain', 'resize', 'separate', 'stabilizer', 'status', 'stereo',
-            'stereoAnaglyph', 'stereoInterlace', 'stereoToolbox', 'stylize',
-            'substance', 'tangentPanel', 'text', 'timewarp', 'tmp', 'vectorViewer', 'viewing']
-        for node in user_nodes:
-            self._create_node(parent=user_node, node_type=WiretapNodeType.Node, node_name=node)
-
-        return user_node
+        return self.create_users([user_name], workers=workers)[0]
+
+    def create_users(self, user_names, workers=8):
+        """
+        Create several Flame Family users at once.
+        All nodes are created concurrently, parents before their children.
+
+        :param user_names: The usernames to create
+        :type user_names: list
+        :param workers: maximum number of nodes created concurrently
+        :type workers: int
+        :return: user nodes, in the order of user_names
+        :rtype: list
+        :raises BulkCreateError: if some nodes can't be created, with the
+            failures of every user
+        """
+        # bulk depends on this module
+        from bulk import BulkNodeCreator, NodeSpec
+
+        specs = [
+            NodeSpec(user_name, WiretapNodeType.User, [
+                NodeSpec(node, WiretapNodeType.Node) for node in USER_NODES])
+            for user_name in user_names]
+        paths = BulkNodeCreator(self, workers=workers).create('/users', specs)
+
+        return [wt.WireTapNodeHandle(self._server, path) for path in paths]
 
     def get_projects(self):
         """
@@ -154,10 +342,7 @@ class WiretapHandler(object):
         :return: projects
         :rtype: list
         """
-        projects_node = self._get_node_from_path('/projects')
-        children = self._get_children(projects_node)
-
-        return children.keys()
+        return [name for (name, _, _) in self._list_children('/projects', with_types=False)]
 
     def get_project(self, project_name):
         """
@@ -170,6 +355,135 @@ class WiretapHandler(object):
         """
         return self._get_node_from_path("/projects/%s" % project_name)
 
+    def get_project_settings(self, project_name, server=None):
+        """
+        Retrieve the settings of a project.
+        Settings are kept for the life of the handler.
+
+        :param project_name: project name
+        :type project_name: string
+        :param server: server handle to use instead of the handler one
+        :type server: WireTapServerHandle
+        :return: project settings, ex: {'FrameWidth': '1920', 'FrameRate': '25 fps', ...}
+        :rtype: dict
+        :raises WiretapException: if the project metadata can't be read
+        """
+        with self._project_settings_lock:
+            settings = self._project_settings.get(project_name)
+        if settings is None:
+            settings = parse_project_xml(self._read_metadata("/projects/%s" % project_name, server=server))
+            with self._project_settings_lock:
+                self._project_settings[project_name] = settings
+        return settings
+
+    def get_projects_settings(self, project_names=None, workers=8):
+        """
+        Retrieve the settings of many projects concurrently
+
+        :param project_names: project names, all projects if None
+        :type project_names: list
+        :param workers: number of projects read at the same time
+        :type workers: int
+        :return: settings of each project, None for projects which can't be read
+        :rtype: dict
+        """
+        if project_names is None:
+            project_names = self.get_projects()
+        if not project_names:
+            return dict()
+
+        servers = ThreadServers(self)
+
+        def fetch(project_name):
+            try:
+                return project_name, self.get_project_settings(project_name, server=servers.get())
+            except WiretapException as e:
+                logger.error("Unable to read settings of project %s: %s" % (project_name, e))
+                return project_name, None
+
+        pool = ThreadPool(max(1, min(workers, len(project_names))))
+        try:
+            return dict(pool.map(fetch, project_names))
+        finally:
+            pool.close()
+            pool.join()
+            servers.release()
+
+    def get_project_xml(self, project_name):
+        """
+        Retrieve the raw XML metadata of a project
+
+        :param project_name: project name
+        :type project_name: string
+        :rtype: string
+        :raises WiretapException: if the project metadata can't be read
+        """
+        return self._read_metadata("/projects/%s" % project_name)
+
+    def set_project_xml(self, project_name, xml):
+        """
+        Replace the XML metadata of a project
+
+        :param project_name: project name
+        :type project_name: string
+        :param xml: the project XML metadata, ex: '<Project><FrameRate>25 fps</FrameRate></Project>'
+        :type xml: string
+        :raises WiretapException: if the project metadata can't be written
+        """
+        project_node = wt.WireTapNodeHandle(self._server, "/projects/%s" % project_name)
+        try:
+            if not project_node.setMetaData("XML", xml):
+                raise WiretapException("Error setting metadata for %s: %s" % (project_name, project_node.lastError()))
+        finally:
+            with self._project_settings_lock:
+                self._project_settings.pop(project_name, None)
+
+    def update_project_settings(self, project_name, settings, dry_run=False):
+        """
+        Change some settings of a project. The metadata is only written if a
+        setting differs from the current one.
+
+        :param project_name: project name
+        :type project_name: string
+        :param settings: settings to change, None values remove the setting
+        :type settings: dict
+        :param dry_run: only compute the changes
+        :type dry_run: bool
+        :return: changed settings, ex: {'SetupDir': ('/old/setups', '/new/setups')}
+        :rtype: dict
+        :raises WiretapException: if the project metadata can't be read or written
+        """
+        xml, changes = update_project_xml(self.get_project_xml(project_name), settings)
+        if xml is not None and not dry_run:
+            self.set_project_xml(project_name, xml)
+        return changes
+
+    def update_projects(self, pattern, settings, regex=False, ignore_case=False, workers=8, dry_run=False):
+        """
+        Change some settings of every project matching a pattern, updating
+        projects concurrently
+
+        :param pattern: glob pattern matching the whole project name, or
+            regular expression searched in the name if regex is set
+        :type pattern: string
+        :param settings: settings to change, None values remove the setting
+        :type settings: dict
+        :param regex: whether the pattern is a regular expression
+        :type regex: bool
+        :param ignore_case: match names regardless of case
+        :type ignore_case: bool
+        :param workers: number of projects updated at the same time
+        :type workers: int
+        :param dry_run: only compute the changes
+        :type dry_run: bool
+        :return: a ProjectUpdate per matching project, in completion order
+        :rtype: generator
+        """
+        # update depends on this module
+        from update import update_projects
+        return update_projects(
+            self, pattern, settings, regex=regex, ignore_case=ignore_case, workers=workers, dry_run=dry_run)
+
     def get_users(self):
         """
         Retrieve all users from the database
@@ -177,10 +491,7 @@ class WiretapHandler(object):
         :return: users
         :rtype: list
         """
-        users_node = self._get_node_from_path('/users')
-        children = self._get_children(users_node)
-
-        return children.keys()
+        return [name for (name, _, _) in self._list_children('/users', with_types=False)]
 
     def get_user(self, user_name):
         """
@@ -201,8 +512,14 @@ class WiretapHandler(object):
         :type user_name: string
         """
         user_node = self.get_user(user_name)
+        if user_node is None:
+            raise WiretapException("User %s not found" % user_name)
+        user_path = self._node_path(user_node)
         if not user_node.destroyNode():
             raise WiretapException("Unable to delete user: %s" % user_node.lastError())
+        self.cache.invalidate('/users')
+        for index in self._indexes.values():
+            index.discard(user_path)
 
     def get_volumes(self):
         """
@@ -211,11 +528,179 @@ class WiretapHandler(object):
         :return: List of volumes available
         :rtype: list
         """
+        return [name for (name, _, _) in self._list_children('/volumes', with_types=False)]
 
-        volumes_node = self._get_node_from_path('/volumes')
-        children = self._get_children(volumes_node)
+    def choose_volume(self, placement='first', volume=None, dry_run=False):
+        """
+        Choose the volume of a new project
+
+        :param placement: policy choosing the volume: 'first', 'most-free',
+            'fewest-projects', 'round-robin' or one added with placement.register_policy
+        :type placement: string
+        :param volume: volume to use, bypassing the policy
+        :type volume: string
+        :param dry_run: choose the volume without changing the state of the policy
+        :type dry_run: bool
+        :return: the chosen volume, with the usage read to choose it
+        :rtype: VolumeInfo
+        :raises WiretapException: if the server has no volume, or not the requested one
+        """
+        # placement depends on this module
+        from placement import choose_volume
+        return choose_volume(self, placement=placement, volume=volume, dry_run=dry_run)
+
+    def walk(self, path='/', max_depth=None, node_types=None, with_depth=False):
+        """
+        Walk the node tree depth first, yielding nodes as they are discovered.
+        Only the nodes on the way from the top node are kept in memory.
+
+        :param path: path of the node to walk from, not yielded itself
+        :type path: string
+        :param max_depth: how deep to walk, 1 for the children only, None for no limit
+        :type max_depth: int
+        :param node_types: only yield nodes of these types. Nodes which can't
+            contain any of these types are not walked through
+        :type node_types: list
+        :param with_depth: also yield the depth of each node, 1 for the children
+        :type with_depth: bool
+        :return: (path, name, type) or (path, name, type, depth) tuples
+        :rtype: generator
+        :raises WiretapException: if a node can't be read
+        """
+        node_types = set(node_types) if node_types else None
 
-        return children.keys()
+        def walk_into(node_type):
+            if node_types is None:
+                return True
+            return any(may_contain(node_type, t) for t in node_types)
+
+        def open_node(node_path):
+            node = wt.WireTapNodeHandle(self._server, node_path)
+            num_children = wt.WireTapInt(0)
+            if not node.getNumChildren(num_children):
+                raise WiretapException(
+                    "Unable to obtain number of children for node %s: %s" % (node_path, node.lastError()))
+            return [node, int(num_children), 0]
+
+        if max_depth is not None and max_depth < 1:
+            return
+
+        # stack of [node handler, number of children, next child index]
+        stack = [open_node(path)]
+        while stack:
+            frame = stack[-1]
+            parent, num_children, child_idx = frame
+            if child_idx >= num_children:
+                stack.pop()
+                continue
+            frame[2] += 1
+
+            child = wt.WireTapNodeHandle()
+            if not parent.getChild(child_idx, child):
+                raise WiretapException("Unable to get child: %s" % parent.lastError())
+
+            node_name = wt.WireTapStr()
+            if not child.getDisplayName(node_name):
+                raise WiretapException("Unable to get child name: %s" % child.lastError())
+
+            node_type = wt.WireTapStr()
+            if not child.getNodeTypeStr(node_type):
+                raise WiretapException("Unable to obtain child type: %s" % child.lastError())
+
+            child_path = self._node_path(child)
+            depth = len(stack)
+            if node_types is None or node_type.c_str() in node_types:
+                if with_depth:
+                    yield (child_path, node_name.c_str(), node_type.c_str(), depth)
+                else:
+                    yield (child_path, node_name.c_str(), node_type.c_str())
+
+            if (max_depth is None or depth < max_depth) and walk_into(node_type.c_str()):
+                stack.append(open_node(child_path))
+
+    def get_node(self, path):
+        """
+        Describe a node without reading it, its name, type and children are
+        read on first access
+
+        :param path: path of the node
+        :type path: string
+        :rtype: Node
+        """
+        # node depends on this module
+        from node import Node
+        return Node(self, path)
+
+    def get_tree(self, path='/', max_depth=None):
+        """
+        Read a subtree into compact Node objects, each node being listed once
+
+        :param path: path of the top node
+        :type path: string
+        :param max_depth: how deep to read, 1 for the children only, None for no limit
+        :type max_depth: int
+        :return: the top node
+        :rtype: Node
+        """
+        from node import build_tree
+        return build_tree(self, path, max_depth=max_depth)
+
+    def watcher(self, paths=('/projects', '/users'), max_depth=1, min_interval=1.0, max_interval=60.0,
+                verify_every=10, workers=8):
+        """
+        Build a watcher reporting nodes created and deleted below some nodes
+
+        :param paths: paths of the watched nodes
+        :type paths: list
+        :param max_depth: how deep to watch, 1 for the children of the watched nodes only
+        :type max_depth: int
+        :param min_interval: delay in seconds between polls after a change
+        :type min_interval: float
+        :param max_interval: longest delay in seconds between polls when nothing changes
+        :type max_interval: float
+        :param verify_every: list all nodes every this number of polls, 0 to only rely on child counts
+        :type verify_every: int
+        :param workers: number of nodes polled at the same time
+        :type workers: int
+        :rtype: Watcher
+        """
+        # watch depends on this module
+        from watch import Watcher
+        return Watcher(
+            self, paths, max_depth=max_depth, min_interval=min_interval, max_interval=max_interval,
+            verify_every=verify_every, workers=workers)
+
+    def find(self, pattern='*', path='/', node_types=None, regex=False, ignore_case=False,
+             limit=None, max_depth=None, workers=8):
+        """
+        Search nodes by name and type, listing independent nodes concurrently.
+        Nodes which can't contain any of the searched types are not listed.
+
+        :param pattern: glob pattern matching the whole name, or regular
+            expression searched in the name if regex is set
+        :type pattern: string
+        :param path: path of the node to search from
+        :type path: string
+        :param node_types: only find nodes of these types
+        :type node_types: list
+        :param regex: whether the pattern is a regular expression
+        :type regex: bool
+        :param ignore_case: match names regardless of case
+        :type ignore_case: bool
+        :param limit: stop after this number of matches, None for all
+        :type limit: int
+        :param max_depth: how deep to search, 1 for the children only, None for no limit
+        :type max_depth: int
+        :param workers: number of nodes listed at the same time
+        :type workers: int
+        :return: (path, name, type, display path) tuples, in the order they are found
+        :rtype: generator
+        """
+        # search depends on this module
+        from search import find
+        return find(
+            self, pattern, path=path, node_types=node_types, regex=regex, ignore_case=ignore_case,
+            limit=limit, max_depth=max_depth, workers=workers)
 
     def _create_node(self, parent, node_type, node_name=None):
         """
@@ -234,11 +719,82 @@ class WiretapHandler(object):
         if not parent.createNode(node_name, node_type, node):
             raise WiretapException("Unable to create node: %s" % parent.lastError())
 
+        self._node_created(self._node_path(parent), node_name, node_type, self._node_path(node))
         return node
 
-    def _create_project_librairies(self, parent, library_name, libraries_dict):
+    def _create_child_node(self, server, parent_path, node_type, node_name):
+        """
+        Create a node through a given server handle.
+        Safe to call from several threads as long as each one uses its own server handle.
+
+        :param server: server handle used for the creation
+        :type server: WireTapServerHandle
+        :param parent_path: path of the parent node
+        :type parent_path: string
+        :param node_type:
+        :type node_type: string
+        :param node_name:
+        :type node_name: string
+        :return: path of the created node
+        :rtype: string
+        :raises WiretapException: if can't create the node
         """
-        Create folders into libraries
+        parent = wt.WireTapNodeHandle(server, parent_path)
+        node = wt.WireTapNodeHandle()
+        if not parent.createNode(node_name, node_type, node):
+            raise WiretapException("Unable to create node: %s" % parent.lastError())
+
+        node_path = self._node_path(node)
+        self._node_created(parent_path, node_name, node_type, node_path)
+        return node_path
+
+    def _node_created(self, parent_path, node_name, node_type, node_path):
+        """
+        Update node cache and subtree indexes after a node creation
+        """
+        self.cache.invalidate(parent_path)
+        for index in self._indexes.values():
+            index.add(parent_path, node_name, node_type, node_path)
+
+    def _new_server(self):
+        """
+        Borrow a server handle from the pool, for use by worker threads.
+        It must be given back with _release_server.
+
+        :rtype: WireTapServerHandle
+        """
+        return _servers.acquire(self.hostname)
+
+    def _release_server(self, server):
+        """
+        Give back a server handle borrowed with _new_server
+
+        :param server: the borrowed handle
+        :type server: WireTapServerHandle
+        """
+        _servers.release(self.hostname, server)
+
+    def plan_project_libraries(self, project_node, library_name, libraries_dict):
+        """
+        Compute the libraries and folders missing from a library list of a project
+
+        :param project_node: project node handler, None if the project does not exist yet
+        :type project_node: WireTapNodeHandle
+        :param library_name: name of the library list
+        :type library_name: string
+        :param libraries_dict: folders to create in each library
+        :type libraries_dict: dict
+        :return: the nodes to create
+        :rtype: reconcile.Plan
+        """
+        # reconcile depends on this module
+        from reconcile import plan_libraries
+        return plan_libraries(self, project_node, library_name, libraries_dict)
+
+    def _create_project_librairies(self, parent, library_name, libraries_dict, workers=8):
+        """
+        Create folders into libraries.
+        Only the libraries and folders which do not exist yet are created.
 
         :param parent: parent node handler
         :type parent: WireTapNodeHandle
@@ -246,15 +802,15 @@ class WiretapHandler(object):
         :type library_name: string
         :param libraries_dict:
         :type libraries_dict: dict
+        :param workers: maximum number of nodes created concurrently
+        :type workers: int
+        :return: the nodes which have been created
+        :rtype: reconcile.Plan
         """
-
-        library_node = self._get_node(parent, library_name, WiretapNodeType.LibraryList)
-        for lib in libraries_dict.keys():
-            lib_node = self._create_node(library_node, WiretapNodeType.Library, lib)
-
-            if libraries_dict[lib]:
-                for folder in libraries_dict[lib]:
-                    self._create_node(lib_node, WiretapNodeType.Folder, folder)
+        plan = self.plan_project_libraries(parent, library_name, libraries_dict)
+        if len(plan):
+            plan.apply(self, workers=workers)
+        return plan
 
     def _get_project_metadata(self, project_node):
         """
@@ -272,6 +828,26 @@ class WiretapHandler(object):
             pretty_xml = minidom.parseString(xml.c_str()).toprettyxml()
             return pretty_xml
 
+    def _read_metadata(self, path, stream_name="XML", server=None):
+        """
+        Retrieve raw metadata of a node
+
+        :param path: the path of the node
+        :type path: string
+        :param stream_name: metadata stream to read
+        :type stream_name: string
+        :param server: server handle to use instead of the handler one
+        :type server: WireTapServerHandle
+        :return: metadata
+        :rtype: string
+        :raises WiretapException: if metadata can't be read
+        """
+        node = wt.WireTapNodeHandle(server or self._server, path)
+        metadata = wt.WireTapStr()
+        if not node.getMetaData(stream_name, "", 1, metadata):
+            raise WiretapException("Unable to get metadata of %s: %s" % (path, node.lastError()))
+        return metadata.c_str()
+
     def _get_node_from_path(self, path):
         """
         Retrieve node handler from path
@@ -281,30 +857,75 @@ class WiretapHandler(object):
         :return: the node handler
         :rtype: WireTapNodeHandle
         """
+        # only the existence of the node is cached: handles are bound to the
+        # server handle of the calling thread, which may be a borrowed one
         node = wt.WireTapNodeHandle(self._server, path)
+        if self.cache.get('node', path):
+            return node
 
         node_name = wt.WireTapStr()
         if node.getDisplayName(node_name):
+            self.cache.set('node', path, True)
             return node
         else:
             return None
 
-    def _get_children(self, parent):
+    def _node_path(self, node):
         """
-        Retrieve all children from a parent node
+        Retrieve the path (node id) of a node handler
 
-        :param parent:
-        :type parent: WireTapNodeHandle
-        :return: a dictionnary contening children of the node handler
-        :rtype: dict
+        :param node: the node handler
+        :type node: WireTapNodeHandle
+        :return: the path of the node
+        :rtype: string
         """
-        children = dict()
+        return node.getNodeId().id()
+
+    def _list_children(self, path, with_types=True):
+        """
+        Retrieve name, type and path of all children of a node.
+        Listings are cached until the node is modified.
+
+        :param path: the path of the parent node
+        :type path: string
+        :param with_types: read the type of the children, which costs a round trip per child
+        :type with_types: bool
+        :return: a list of (name, type, path) tuples, types are None without with_types
+        :rtype: list
+        """
+        # a listing with types also answers a lookup of names
+        children = self.cache.get_any(('children',) if with_types else ('children', 'names'), path)
+        if children is None:
+            children = self._read_children(path, with_types=with_types)
+            self.cache.set('children' if with_types else 'names', path, children)
+        return children
+
+    def _read_children(self, path, server=None, with_types=True):
+        """
+        Retrieve name, type and path of all children of a node from the server
+
+        :param path: the path of the parent node
+        :type path: string
+        :param server: server handle to use instead of the handler one
+        :type server: WireTapServerHandle
+        :param with_types: read the type of the children, which costs a round trip per child
+        :type with_types: bool
+        :return: a list of (name, type, path) tuples, types are None without with_types
+        :rtype: list
+        """
+        parent = wt.WireTapNodeHandle(server or self._server, path)
+
         num_children = wt.WireTapInt(0)
         if not parent.getNumChildren(num_children):
-            raise WiretapException("Unable to obtain number of volumes: %s" % parent.lastError())
+            raise WiretapException(
+                "Wiretap error: Unable to obtain number of "
+                "children for node %s> Please check that your "
+                "wiretap service is running. "
+                "Error reported: %s" % (path, parent.lastError()))
 
-        child_obj = wt.WireTapNodeHandle()
+        children = []
         for child_idx in range(num_children):
+            child_obj = wt.WireTapNodeHandle()
             if not parent.getChild(child_idx, child_obj):
                 raise WiretapException("Unable to get child: %s" % parent.lastError())
 
@@ -312,12 +933,71 @@ class WiretapHandler(object):
             if not child_obj.getDisplayName(node_name):
                 raise WiretapException("Unable to get child name: %s" % child_obj.lastError())
 
-            children[str(node_name)] = child_obj
+            node_type = None
+            if with_types:
+                type_str = wt.WireTapStr()
+                if not child_obj.getNodeTypeStr(type_str):
+                    raise WiretapException("Unable to obtain child type: %s" % child_obj.lastError())
+                node_type = type_str.c_str()
+
+            children.append((node_name.c_str(), node_type, self._node_path(child_obj)))
+
         return children
 
+    def _get_children(self, parent):
+        """
+        Retrieve all children from a parent node
+
+        :param parent:
+        :type parent: WireTapNodeHandle
+        :return: a dictionnary contening children of the node handler
+        :rtype: dict
+        """
+        children = dict()
+        for (name, _, path) in self._list_children(self._node_path(parent), with_types=False):
+            children[name] = wt.WireTapNodeHandle(self._server, path)
+        return children
+
+    def invalidate(self, path):
+        """
+        Forget what is known of a node which may have been modified outside
+        of this handler: its cached lookups and those of its descendants, and
+        the subtree indexes holding it
+
+        :param path: the path of the node
+        :type path: string
+        """
+        self.cache.invalidate(path)
+        self._indexes.invalidate(path)
+        parent_path = path.rstrip('/')
+        while parent_path:
+            parent_path = parent_path.rsplit('/', 1)[0]
+            self._indexes.pop('index', parent_path or '/')
+
+    def clear_cache(self):
+        """
+        Forget all cached node lookups, subtree indexes and project settings
+        """
+        self.cache.clear()
+        self.volume_cache.clear()
+        self._indexes.clear()
+        with self._project_settings_lock:
+            self._project_settings.clear()
+
+    def cache_stats(self):
+        """
+        Return node cache counters
+
+        :return: hits, misses, evictions and size of the cache
+        :rtype: dict
+        """
+        return self.cache.stats()
+
     def _get_node(self, parent_node, node_name, node_type):
         """
-        Get a node
+        Get a node anywhere below a parent node.
+        The subtree is indexed by name and type on first search, so later
+        searches below the same parent do not hit the server again.
 
         :param parent_node: Node from which we want to search
         :type parent_node: WireTapNodeHandle
@@ -328,51 +1008,17 @@ class WiretapHandler(object):
         :returns: the searched node
         :rtype: WireTapNodeHandle
         """
-        parent_node_name = wt.WireTapStr()
-
-        if not parent_node.getDisplayName(parent_node_name):
-            raise WiretapException("Couldn't get node name: %s" % parent_node.lastError())
-        # logger.debug("parent node name: %s" % parent_node_name)
-
-        num_children = wt.WireTapInt(0)
-        if not parent_node.getNumChildren(num_children):
-            raise WiretapException("Couldn't get children number for the node %s: %s" % (parent_node_name.c_str(), parent_node.lastError()))
-        # logger.debug("parent num children: %s" % int(num_children))
-
-        result_node = None
-        child_node = wt.WireTapNodeHandle()
-        child_node_type = wt.WireTapStr()
-        child_node_name = wt.WireTapStr()
-
-        # iterate over children
-        for child_idx in range(num_children):
-            # get child node
-            if not parent_node.getChild(child_idx, child_node):
-                raise WiretapException("Unable to get child: %s" % parent_node.lastError())
-            # logger.debug("child: %s" % child_node)
-
-            # get child node name
-            if not child_node.getDisplayName(child_node_name):
-                raise WiretapException("Couldn't get node name: %s" % child_node.lastError())
-            # logger.debug("child node name: %s" % child_node_name.c_str())
-
-            # get child node type
-            if not child_node.getNodeTypeStr(child_node_type):
-                raise WiretapException("Couldn't get node type: %s" % child_node.lastError())
-            # logger.debug("child node type: %s" % child_node_type.c_str())
-
-            # check if child match criteria
-            if child_node_name.c_str() == node_name and child_node_type.c_str() == node_type:
-                result_node = child_node
-                # logger.debug("node found !")
-                break
-
-            result_node = self._get_node(child_node, node_name, node_type)
-            if result_node:
-                # logger.debug("node found !")
-                return result_node
-
-        return result_node
+        parent_path = self._node_path(parent_node)
+        index = self._indexes.get('index', parent_path)
+        if index is None:
+            # subtree listings bypass the node cache to keep it for hot paths
+            index = NodeIndex(parent_path, self._read_children)
+            self._indexes.set('index', parent_path, index)
+
+        node_path = index.find(node_name, node_type)
+        if node_path is None:
+            return None
+        return wt.WireTapNodeHandle(self._server, node_path)
 
     def _child_node_exists(self, parent_path, child_name, child_type):
         """
@@ -386,35 +1032,8 @@ class WiretapHandler(object):
         :type child_type: str
         :returns: Type if node exists, false otherwize.
         """
-        # get the parent
-        parent = wt.WireTapNodeHandle(self._server, parent_path)
-
-        # get number of children
-        num_children = wt.WireTapInt(0)
-        if not parent.getNumChildren(num_children):
-            raise WiretapException(
-                "Wiretap error: Unable to obtain number of "
-                "children for node %s> Please check that your "
-                "wiretap service is running. "
-                "Error reported: %s" % (parent_path, parent.lastError()))
-
-        # iterate over children, look for the given node
-        child_obj = wt.WireTapNodeHandle()
-        for child_idx in range(num_children):
-            # get the child
-            if not parent.getChild(child_idx, child_obj):
-                raise WiretapException("Unable to get child: %s" % parent.lastError())
-
-            node_name = wt.WireTapStr()
-            node_type = wt.WireTapStr()
-
-            if not child_obj.getDisplayName(node_name):
-                raise WiretapException("Unable to get child: %s" % child_obj.lastError())
-
-            if not child_obj.getNodeTypeStr(node_type):
-                raise WiretapException("Unable to obtain child type: %s" % child_obj.lastError())
-
-            if node_name.c_str() == child_name and node_type.c_str() == child_type:
+        for (name, node_type, _) in self._list_children(parent_path):
+            if name == child_name and node_type == child_type:
                 return True
 
         return False